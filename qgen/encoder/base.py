@@ -16,3 +16,6 @@ class BaseEncoder:
             vectors.append(self.get_vector(sentence))
 
         return np.array(vectors)
+
+    def close(self):
+        pass
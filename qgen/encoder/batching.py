@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from ..util.metrics import Histogram, LatencyHistogram
+
+# Default maximum number of texts per forward pass
+MAX_BATCH_SIZE = 256
+# Default maximum time (in seconds) a request waits for other requests to share its forward pass
+MAX_WAIT = 0.002
+
+
+class _Request:
+    def __init__(self, texts):
+        self.texts = texts
+        self.embeddings = None
+        self.error = None
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """ Front end of an encoding function that coalesces concurrent requests into forward passes of bounded size.
+
+    Requests are queued and served by a background thread: it waits up to `max_wait` for more requests once it has one,
+    sorts the texts of all the requests it gathered by length (so that the texts of a forward pass need little padding),
+    encodes them by chunks of at most `max_batch_size` texts and scatters the embeddings back to each request.
+    """
+
+    def __init__(self, encode, dimension, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT):
+        """
+        :param encode: function that returns the embeddings of a list of texts, as an array
+        :param dimension: dimension of the embeddings
+        :param max_batch_size: maximum number of texts per call to `encode`
+        :param max_wait: maximum time (in seconds) to wait for other requests before encoding
+        """
+        self.encode = encode
+        self.dimension = dimension
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.num_requests = 0
+        self.batch_sizes = Histogram()
+        self.batch_latency = LatencyHistogram()
+        self.wait_latency = LatencyHistogram()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get_vectors(self, texts):
+        """ Returns the embeddings of `texts`, blocking until the forward passes holding them are done.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._serve, daemon=True)
+                self._thread.start()
+            self.num_requests += 1
+            request = _Request(texts)
+            self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+
+        return request.embeddings
+
+    def _gather(self):
+        """ Returns the requests to serve together, and whether the batcher is closed.
+        """
+        requests = [self._queue.get()]
+        if requests[0] is None:
+            return [], True
+
+        size = len(requests[0].texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # the requests gathered so far are served before stopping
+                return requests, True
+            requests.append(request)
+            size += len(request.texts)
+
+        return requests, False
+
+    def _serve(self):
+        closed = False
+        while not closed:
+            requests, closed = self._gather()
+            now = time.perf_counter()
+            for request in requests:
+                self.wait_latency.record(now - request.submitted)
+            try:
+                self._encode(requests)
+            except Exception as e:
+                for request in requests:
+                    request.error = e
+            finally:
+                for request in requests:
+                    request.done.set()
+
+    def _encode(self, requests):
+        for request in requests:
+            request.embeddings = np.empty((len(request.texts), self.dimension), dtype=np.float32)
+        # (length, request, position) of every text, shortest first
+        texts = sorted((len(text), i, j) for i, request in enumerate(requests) for j, text in enumerate(request.texts))
+        for start in range(0, len(texts), self.max_batch_size):
+            batch = texts[start:start + self.max_batch_size]
+            with self.batch_latency.time():
+                embeddings = self.encode([requests[i].texts[j] for _, i, j in batch])
+            self.batch_sizes.record(len(batch))
+            for (_, i, j), embedding in zip(batch, embeddings):
+                requests[i].embeddings[j] = embedding
+
+    def stats(self):
+        return {
+            'requests': self.num_requests,
+            'batches': self.batch_sizes.count,
+            'batch_size': self.batch_sizes.stats(),
+            'batch_latency': self.batch_latency.stats(),
+            'wait_latency': self.wait_latency.stats()
+        }
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
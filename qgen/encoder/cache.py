@@ -0,0 +1,81 @@
+import hashlib
+
+import numpy as np
+
+from .base import BaseEncoder
+from ..util.cache import LRUCache, SqliteStore, TieredCache
+from ..util.metrics import LatencyHistogram
+
+# Default maximum size of the embeddings kept in memory, in bytes
+EMBEDDING_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class CachedEncoder(BaseEncoder):
+    """ Wrapper of an encoder that caches the embeddings of the texts it has encoded.
+
+    Embeddings are kept in memory up to a total size in bytes and, optionally, in a sqlite database keyed by the
+    encoder name and a hash of the text, so that they survive across runs. Only the texts missing from both tiers are
+    forwarded to the wrapped encoder, in a single call.
+    """
+
+    def __init__(self, encoder, max_bytes=EMBEDDING_CACHE_BYTES, path=None):
+        """
+        :param encoder: wrapped encoder
+        :param max_bytes: maximum size of the embeddings kept in memory in bytes, unbounded if None
+        :param path: path to the sqlite database persisting the embeddings. Disabled if None.
+        """
+        super().__init__(encoder.name, encoder.dimension, encoder.model_path)
+
+        self.encoder = encoder
+        store = None if path is None else SqliteStore(path, 'embeddings')
+        self.cache = TieredCache(LRUCache(max_bytes=max_bytes, sizeof=lambda vector: vector.nbytes), store)
+        self.num_encoded = 0
+        self.lookup_latency = LatencyHistogram()
+        self.encode_latency = LatencyHistogram()
+
+    def _get_key(self, text):
+        # the encoder name is part of the key, so that a database can be shared by several encoders
+        return f"{self.name}:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+    def get_vector(self, sentence):
+        return self.get_vectors([sentence])[0]
+
+    def get_vectors(self, sentences):
+        with self.lookup_latency.time():
+            keys = [self._get_key(sentence) for sentence in sentences]
+            vectors = self.cache.get_many(keys)
+
+        missing = list(dict.fromkeys(sentence for sentence, key in zip(sentences, keys) if key not in vectors))
+        if missing:
+            with self.encode_latency.time():
+                encoded = self.encoder.get_vectors(missing)
+            items = [(self._get_key(sentence), np.array(vector, dtype=np.float32))
+                     for sentence, vector in zip(missing, encoded)]
+            self.cache.put_many(items)
+            # read from the batch itself, since the memory tier may evict part of a batch larger than itself
+            vectors.update(items)
+            self.num_encoded += len(missing)
+
+        embeddings = np.empty((len(sentences), self.dimension), dtype=np.float32)
+        for i, key in enumerate(keys):
+            embeddings[i] = vectors[key]
+
+        return embeddings
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        """ Returns the hit rates and sizes of the cache tiers, the number of texts encoded by the wrapped encoder and
+        the latency histograms of the cache lookups and of the calls to the wrapped encoder.
+        """
+        return {
+            'cache': self.cache.stats(),
+            'encoded': self.num_encoded,
+            'lookup_latency': self.lookup_latency.stats(),
+            'encode_latency': self.encode_latency.stats()
+        }
+
+    def close(self):
+        self.cache.close()
+        self.encoder.close()
@@ -1,4 +1,5 @@
 import fasttext
+import numpy as np
 
 from .base import BaseEncoder
 
@@ -8,6 +9,40 @@ class FTEncoder(BaseEncoder):
         super().__init__("fastText", 300, model_path)
 
         self.model = fasttext.load_model(self.model_path)
+        # sentence vectors of supervised models also average the word n-grams, which are not exposed by the bindings
+        self.supervised = self.model.f.getArgs().model.name == 'supervised'
 
     def get_vector(self, sentence):
-        return self.model.get_sentence_vector(sentence)
+        return self.get_vectors([sentence])[0]
+
+    def get_vectors(self, sentences):
+        """ Average the L2-normalized word vectors of each sentence, as `get_sentence_vector` does for unsupervised
+        models. Each distinct word of the batch is only looked up once.
+        """
+        embeddings = np.zeros((len(sentences), self.dimension), dtype=np.float32)
+        if self.supervised:
+            for i, sentence in enumerate(sentences):
+                embeddings[i] = self.model.get_sentence_vector(sentence)
+            return embeddings
+
+        words = [sentence.split() for sentence in sentences]
+        vocabulary = list(dict.fromkeys(word for sentence_words in words for word in sentence_words))
+        word_ids = {word: i for i, word in enumerate(vocabulary)}
+        word_vectors = np.zeros((len(vocabulary), self.dimension), dtype=np.float32)
+        for i, word in enumerate(vocabulary):
+            word_vectors[i] = self.model.get_word_vector(word)
+        norms = np.linalg.norm(word_vectors, axis=1)
+        # words whose vector is null are skipped
+        known = norms > 0
+        word_vectors[known] /= norms[known, None]
+
+        rows = [[word_ids[word] for word in sentence_words if known[word_ids[word]]] for sentence_words in words]
+        lengths = np.array([len(sentence_rows) for sentence_rows in rows], dtype=np.int64)
+        rows = np.array([row for sentence_rows in rows for row in sentence_rows], dtype=np.int64)
+        non_empty = lengths > 0
+        if rows.size > 0:
+            starts = np.cumsum(lengths) - lengths
+            sums = np.add.reduceat(word_vectors[rows], starts[non_empty], axis=0)
+            embeddings[non_empty] = sums / lengths[non_empty, None]
+
+        return embeddings
@@ -1,13 +1,43 @@
+import numpy as np
 import spacy
 
 from .base import BaseEncoder
 
+# Number of sentences tokenized together by spaCy
+_BATCH_SIZE = 1000
+
 
 class GloveEncoder(BaseEncoder):
     def __init__(self, model_path):
         super().__init__("Average GloVe", 300, model_path)
 
         self.nlp = spacy.load(model_path)
+        # word vectors are gathered straight from the vocabulary matrix, without copying it
+        self.vectors = self.nlp.vocab.vectors.data
+        self.key2row = self.nlp.vocab.vectors.key2row
 
     def get_vector(self, sentence):
-        return self.nlp(sentence).vector
+        return self.get_vectors([sentence])[0]
+
+    def get_vectors(self, sentences):
+        """ Average the GloVe vectors of the tokens of each sentence, as `Doc.vector` does: tokens without vector count
+        as zero vectors.
+        """
+        rows, lengths = [], []
+        # only the tokenizer is needed, the vectors do not depend on the other components
+        for doc in self.nlp.pipe(sentences, batch_size=_BATCH_SIZE, disable=['tagger', 'parser', 'ner']):
+            rows.extend(self.key2row.get(token.orth, -1) for token in doc)
+            lengths.append(len(doc))
+        rows = np.array(rows, dtype=np.int64)
+        lengths = np.array(lengths, dtype=np.int64)
+
+        embeddings = np.zeros((len(lengths), self.dimension), dtype=np.float32)
+        non_empty = lengths > 0
+        if rows.size > 0:
+            token_vectors = self.vectors[np.maximum(rows, 0)]
+            token_vectors[rows < 0] = 0
+            starts = np.cumsum(lengths) - lengths
+            sums = np.add.reduceat(token_vectors, starts[non_empty], axis=0)
+            embeddings[non_empty] = sums / lengths[non_empty, None]
+
+        return embeddings
@@ -3,10 +3,16 @@ import tensorflow as tf
 import tensorflow_hub as hub
 
 from .base import BaseEncoder
+from .batching import MAX_BATCH_SIZE, MAX_WAIT, MicroBatcher
 
 
 class USEEncoder(BaseEncoder):
-    def __init__(self, model_path):
+    def __init__(self, model_path, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT):
+        """
+        :param model_path: path to the TF Hub module
+        :param max_batch_size: maximum number of sentences per forward pass
+        :param max_wait: maximum time (in seconds) a call waits for concurrent calls to share its forward passes
+        """
         super().__init__("Universal Sentence Encoder", 512, model_path)
 
         def init():
@@ -20,9 +26,19 @@ class USEEncoder(BaseEncoder):
             return lambda sentences: np.array(session.run(encode_sentence, {sentence_placeholder: sentences}))
 
         self.encode_sentences = init()
+        # calls are coalesced (across threads) and split into length-sorted forward passes of bounded size
+        self.batcher = MicroBatcher(self.encode_sentences, self.dimension, max_batch_size, max_wait)
 
     def get_vector(self, sentence):
         return self.get_vectors([sentence])[0]
 
     def get_vectors(self, sentences):
-        return self.encode_sentences(sentences)
+        return self.batcher.get_vectors(sentences)
+
+    def stats(self):
+        """ Returns the number of calls and the size and latency histograms of the forward passes
+        """
+        return self.batcher.stats()
+
+    def close(self):
+        self.batcher.close()
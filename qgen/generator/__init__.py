@@ -1,7 +1,8 @@
 from .eda import EDAGenerator
 from .fpm.fpm import FPMGenerator
+from .hybrid import HybridGenerator
 from .imt import IMTGenerator
 from .symsub import SymSubGenerator
 from .zeroshot import ZeroShotGenerator
 
-__all__ = ["FPMGenerator", "SymSubGenerator", "IMTGenerator", "ZeroShotGenerator", "EDAGenerator"]
+__all__ = ["FPMGenerator", "SymSubGenerator", "HybridGenerator", "IMTGenerator", "ZeroShotGenerator", "EDAGenerator"]
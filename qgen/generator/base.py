@@ -5,5 +5,15 @@ class BaseGenerator:
     def generate(self, sentence):
         raise NotImplementedError("'generate' is not implemented")
 
+    def iter_generate(self, sentences):
+        """ Yield (source, generated_list) pairs as soon as they are generated, so that callers can stream results
+            instead of holding them all in memory.
+        """
+        for sentence in sentences:
+            yield sentence, self.generate(sentence)
+
     def batch_generate(self, sentences):
-        raise NotImplementedError("'batch_generate' is not implemented")
+        return dict(self.iter_generate(sentences))
+
+    def close(self):
+        pass
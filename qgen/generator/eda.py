@@ -2,16 +2,30 @@
 # Jason Wei and Kai Zou
 # Original codes adapted from https://github.com/jasonwei20/eda_nlp
 
+import itertools
+import multiprocessing
 import random
 import re
-from random import shuffle
 
-from nltk.corpus import wordnet
+import numpy as np
 from tqdm import tqdm
 
 from .base import BaseGenerator
+from ..util.cache import LRUCache
+from ..util.wordnet import get_synonyms
 
-random.seed(42)
+# Default number of words whose synonyms are kept in memory
+SYNONYM_CACHE_SIZE = 100000
+
+# Number of sentences sent to a worker process at a time
+_CHUNK_SIZE = 256
+# Number of chunks read ahead per worker process when streaming
+_CHUNKS_PER_WORKER = 4
+
+_BACKENDS = ['python', 'numpy']
+
+_APOSTROPHES = str.maketrans({"’": None, "'": None})
+_NON_LETTERS = re.compile('[^a-z]+')
 
 STOP_WORDS = ['i', 'me', 'my', 'myself', 'we', 'our',
               'ours', 'ourselves', 'you', 'your', 'yours',
@@ -35,72 +49,111 @@ STOP_WORDS = ['i', 'me', 'my', 'myself', 'we', 'our',
               'very', 's', 't', 'can', 'will', 'just', 'don',
               'should', 'now', '']
 
+_worker_generator = None  # generator owned by a worker process of `EDAGenerator.iter_generate`
+
+
+def _init_worker(alpha_sr, alpha_ri, alpha_rs, p_rd, num_aug, seed, synonym_table, synonym_cache_size, backend):
+    global _worker_generator
+    _worker_generator = EDAGenerator(alpha_sr, alpha_ri, alpha_rs, p_rd, num_aug, seed, synonym_table,
+                                     synonym_cache_size, backend=backend)
+
+
+def _generate_in_worker(chunk):
+    return _worker_generator._generate_chunk(chunk)
+
 
 class EDAGenerator(BaseGenerator):
     """ Generate questions via Easy Data Augmentation Techniques (Reference: https://arxiv.org/abs/1901.11196). """
 
-    def __init__(self, alpha_sr=0.1, alpha_ri=0.1, alpha_rs=0.1, p_rd=0.1, num_aug=9):
+    def __init__(self, alpha_sr=0.1, alpha_ri=0.1, alpha_rs=0.1, p_rd=0.1, num_aug=9, seed=42, synonym_table=None,
+                 synonym_cache_size=SYNONYM_CACHE_SIZE, backend='python', workers=1):
         """
         :param alpha_sr: ratio of words to be replaced by synonyms
         :param alpha_ri: ratio of words to be inserted
         :param alpha_rs: ratio of words to be swapped
         :param p_rd: probability that a word will be deleted
         :param num_aug: number of augmentations
+        :param seed: seed of the random number generators. The i-th sentence of a stream is augmented with its own
+                     generator seeded by (seed, i), so the output does not depend on the number of workers.
+        :param synonym_table: `SynonymTable` of precomputed synonyms. Words missing from the table are looked up in
+                              WordNet.
+        :param synonym_cache_size: maximum number of words whose synonyms are kept in memory, unbounded if None
+        :param backend: 'python' applies the operations word by word, as the reference implementation. 'numpy'
+                        encodes each sentence to an array of word ids and applies every operation to all the
+                        augmentations of the sentence at once. Both backends are deterministic, but they draw different
+                        random numbers, hence generate different questions.
+        :param workers: number of worker processes used by `iter_generate`
         """
         super().__init__("Easy Data Augmentation Techniques")
 
+        if backend not in _BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {_BACKENDS}")
+
         self.alpha_sr = alpha_sr
         self.alpha_ri = alpha_ri
         self.alpha_rs = alpha_rs
         self.p_rd = p_rd
         self.num_aug = num_aug
+        self.seed = seed
+        self.synonym_table = synonym_table
+        self.synonym_cache_size = synonym_cache_size
+        self.backend = backend
+        self.workers = workers
+        self._synonyms = LRUCache(synonym_cache_size)
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                              initargs=(self.alpha_sr, self.alpha_ri, self.alpha_rs, self.p_rd,
+                                                        self.num_aug, self.seed, self.synonym_table,
+                                                        self.synonym_cache_size, self.backend))
+
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _get_rng(self, index):
+        if self.backend == 'numpy':
+            return np.random.default_rng([self.seed, index])
+
+        # seeding with a string hashes it with SHA-512, so the stream is the same in every process
+        return random.Random(f"{self.seed}:{index}")
 
     @staticmethod
     def _get_only_chars(line):
-        clean_line = ""
-
-        line = line.replace("’", "")
-        line = line.replace("'", "")
-        line = line.replace("-", " ")  # replace hyphens with spaces
-        line = line.replace("\t", " ")
-        line = line.replace("\n", " ")
-        line = line.lower()
-
-        for char in line:
-            if char in 'qwertyuiopasdfghjklzxcvbnm ':
-                clean_line += char
-            else:
-                clean_line += ' '
-
-        clean_line = re.sub(' +', ' ', clean_line)  # delete extra spaces
-        if clean_line[0] == ' ':
+        # every run of characters other than letters (hyphens, tabs, digits, ...) becomes a single space
+        clean_line = _NON_LETTERS.sub(' ', line.translate(_APOSTROPHES).lower())
+        if clean_line.startswith(' '):
             clean_line = clean_line[1:]
         return clean_line
 
-    @staticmethod
-    def _get_synonyms(word):
-        synonyms = set()
-        for syn in wordnet.synsets(word):
-            for l in syn.lemmas():
-                synonym = l.name().replace("_", " ").replace("-", " ").lower()
-                synonym = "".join([char for char in synonym if char in ' qwertyuiopasdfghjklzxcvbnm'])
-                synonyms.add(synonym)
-        if word in synonyms:
-            synonyms.remove(word)
-        return list(synonyms)
+    def _get_synonyms(self, word):
+        synonyms = self._synonyms.get(word)
+        if synonyms is None:
+            synonyms = None if self.synonym_table is None else self.synonym_table.get(word)
+            if synonyms is None:
+                synonyms = get_synonyms(word)
+            self._synonyms.put(word, synonyms)
 
-    @staticmethod
-    def _synonym_replacement(words, n):
+        return synonyms
+
+    def _synonym_replacement(self, words, n, rng):
         """ Replace n words in the sentence with synonyms from wordnet.
         """
         new_words = words.copy()
-        random_word_list = list(set([word for word in words if word not in STOP_WORDS]))
-        random.shuffle(random_word_list)
+        # unique words in order of appearance, so that the shuffle does not depend on the hash seed of the process
+        random_word_list = list(dict.fromkeys([word for word in words if word not in STOP_WORDS]))
+        rng.shuffle(random_word_list)
         num_replaced = 0
         for random_word in random_word_list:
-            synonyms = EDAGenerator._get_synonyms(random_word)
+            synonyms = self._get_synonyms(random_word)
             if len(synonyms) >= 1:
-                synonym = random.choice(list(synonyms))
+                synonym = rng.choice(list(synonyms))
                 new_words = [synonym if word == random_word else word for word in new_words]
                 num_replaced += 1
             if num_replaced >= n:  # only replace up to n words
@@ -113,7 +166,7 @@ class EDAGenerator(BaseGenerator):
         return new_words
 
     @staticmethod
-    def _random_deletion(words, p):
+    def _random_deletion(words, p, rng):
         """ Randomly delete words from the sentence with probability p.
         """
         # obviously, if there's only one word, don't delete it
@@ -123,24 +176,24 @@ class EDAGenerator(BaseGenerator):
         # randomly delete words with probability p
         new_words = []
         for word in words:
-            r = random.uniform(0, 1)
+            r = rng.uniform(0, 1)
             if r > p:
                 new_words.append(word)
 
         # if you end up deleting all words, just return a random word
         if len(new_words) == 0:
-            rand_int = random.randint(0, len(words) - 1)
+            rand_int = rng.randint(0, len(words) - 1)
             return [words[rand_int]]
 
         return new_words
 
     @staticmethod
-    def _swap_word(new_words):
-        random_idx_1 = random.randint(0, len(new_words) - 1)
+    def _swap_word(new_words, rng):
+        random_idx_1 = rng.randint(0, len(new_words) - 1)
         random_idx_2 = random_idx_1
         counter = 0
         while random_idx_2 == random_idx_1:
-            random_idx_2 = random.randint(0, len(new_words) - 1)
+            random_idx_2 = rng.randint(0, len(new_words) - 1)
             counter += 1
             if counter > 3:
                 return new_words
@@ -148,41 +201,42 @@ class EDAGenerator(BaseGenerator):
         return new_words
 
     @staticmethod
-    def _random_swap(words, n):
+    def _random_swap(words, n, rng):
         """ Randomly swap two words in the sentence n times
         """
         new_words = words.copy()
         for _ in range(n):
-            new_words = EDAGenerator._swap_word(new_words)
+            new_words = EDAGenerator._swap_word(new_words, rng)
         return new_words
 
-    @staticmethod
-    def _add_word(new_words):
+    def _add_word(self, new_words, rng):
         synonyms = []
         counter = 0
         while len(synonyms) < 1:
-            random_word = new_words[random.randint(0, len(new_words) - 1)]
-            synonyms = EDAGenerator._get_synonyms(random_word)
+            random_word = new_words[rng.randint(0, len(new_words) - 1)]
+            synonyms = self._get_synonyms(random_word)
             counter += 1
             if counter >= 10:
                 return
         random_synonym = synonyms[0]
-        random_idx = random.randint(0, len(new_words) - 1)
+        random_idx = rng.randint(0, len(new_words) - 1)
         new_words.insert(random_idx, random_synonym)
 
-    @staticmethod
-    def _random_insertion(words, n):
+    def _random_insertion(self, words, n, rng):
         """ Randomly insert n words into the sentence
         """
         new_words = words.copy()
         for _ in range(n):
-            EDAGenerator._add_word(new_words)
+            self._add_word(new_words, rng)
         return new_words
 
-    def generate(self, sentence):
+    def _augment(self, sentence, rng):
+        if self.backend == 'numpy':
+            return self._augment_numpy(sentence, rng)
+
         sentence = self._get_only_chars(sentence)
         words = sentence.split(' ')
-        words = [word for word in words if word is not '']
+        words = [word for word in words if word != '']
         num_words = len(words)
 
         augmented_sentences = []
@@ -193,42 +247,176 @@ class EDAGenerator(BaseGenerator):
 
         # sr
         for _ in range(num_new_per_technique):
-            a_words = self._synonym_replacement(words, n_sr)
+            a_words = self._synonym_replacement(words, n_sr, rng)
             augmented_sentences.append(' '.join(a_words))
 
         # ri
         for _ in range(num_new_per_technique):
-            a_words = self._random_insertion(words, n_ri)
+            a_words = self._random_insertion(words, n_ri, rng)
             augmented_sentences.append(' '.join(a_words))
 
         # rs
         for _ in range(num_new_per_technique):
-            a_words = self._random_swap(words, n_rs)
+            a_words = self._random_swap(words, n_rs, rng)
             augmented_sentences.append(' '.join(a_words))
 
         # rd
         for _ in range(num_new_per_technique):
-            a_words = self._random_deletion(words, self.p_rd)
+            a_words = self._random_deletion(words, self.p_rd, rng)
             augmented_sentences.append(' '.join(a_words))
 
         augmented_sentences = [self._get_only_chars(sentence) for sentence in augmented_sentences]
-        shuffle(augmented_sentences)
+        rng.shuffle(augmented_sentences)
 
         # trim so that we have the desired number of augmented sentences
         if self.num_aug >= 1:
             augmented_sentences = augmented_sentences[:self.num_aug]
         else:
             keep_prob = self.num_aug / len(augmented_sentences)
-            augmented_sentences = [s for s in augmented_sentences if random.uniform(0, 1) < keep_prob]
+            augmented_sentences = [s for s in augmented_sentences if rng.uniform(0, 1) < keep_prob]
 
         # append the original sentence
         augmented_sentences.append(sentence)
 
         return augmented_sentences
 
-    def batch_generate(self, sentences):
-        results = dict()
-        for sentence in tqdm(sentences):
-            results[sentence] = self.generate(sentence)
+    def _encode(self, words):
+        """ Encode `words` to an array of ids against a vocabulary made of the distinct words and their synonyms.
+
+        :return: (ids, vocabulary, synonym_ids, synonym_offsets) where the synonyms of the word with id i are
+                 `synonym_ids[synonym_offsets[i]:synonym_offsets[i + 1]]`. Synonyms have no synonyms of their own.
+                 Synonyms are normalized to single-spaced words, so that the decoded sentences need no cleaning.
+        """
+        vocabulary = list(dict.fromkeys(words))
+        word_ids = {word: i for i, word in enumerate(vocabulary)}
+        ids = np.array([word_ids[word] for word in words], dtype=np.int64)
+
+        synonym_ids, synonym_offsets = [], [0]
+        for word in vocabulary[:len(word_ids)]:
+            for synonym in self._get_synonyms(word):
+                synonym = ' '.join(synonym.split())
+                if synonym == '':
+                    continue
+                if synonym not in word_ids:
+                    word_ids[synonym] = len(vocabulary)
+                    vocabulary.append(synonym)
+                synonym_ids.append(word_ids[synonym])
+            synonym_offsets.append(len(synonym_ids))
+        synonym_offsets.extend([len(synonym_ids)] * (len(vocabulary) - len(synonym_offsets) + 1))
+
+        return ids, np.array(vocabulary, dtype=object), np.array(synonym_ids, dtype=np.int64), \
+            np.array(synonym_offsets, dtype=np.int64)
+
+    def _augment_numpy(self, sentence, rng):
+        sentence = self._get_only_chars(sentence)
+        words = sentence.split()
+        num_words = len(words)
+
+        num_new_per_technique = int(self.num_aug / 4) + 1
+        n_sr = max(1, int(self.alpha_sr * num_words))
+        n_ri = max(1, int(self.alpha_ri * num_words))
+        n_rs = max(1, int(self.alpha_rs * num_words))
 
-        return results
+        ids, vocabulary, synonym_ids, synonym_offsets = self._encode(words)
+        num_synonyms = np.diff(synonym_offsets)
+        rows = np.arange(num_new_per_technique)[:, None]
+        augmented_ids = []
+
+        # sr: replace every occurrence of n words (without stop words) by one of their synonyms
+        candidates = np.array([i for i in np.unique(ids) if num_synonyms[i] > 0 and vocabulary[i] not in STOP_WORDS],
+                              dtype=np.int64)
+        replaced = candidates[np.argsort(rng.random((num_new_per_technique, len(candidates))), axis=1)[:, :n_sr]]
+        choices = (rng.random(replaced.shape) * num_synonyms[replaced]).astype(np.int64)
+        mapping = np.repeat(np.arange(len(vocabulary))[None, :], num_new_per_technique, axis=0)
+        mapping[rows, replaced] = synonym_ids[synonym_offsets[replaced] + choices]
+        augmented_ids.extend(mapping[rows, ids])
+
+        # ri: insert the first synonym of n words at random positions
+        sources = ids[num_synonyms[ids] > 0]
+        if len(sources) > 0:
+            inserted = synonym_ids[synonym_offsets[sources[rng.integers(len(sources),
+                                                                        size=(num_new_per_technique, n_ri))]]]
+            positions = np.concatenate([np.broadcast_to(np.arange(num_words, dtype=np.float64),
+                                                        (num_new_per_technique, num_words)),
+                                        rng.integers(num_words + 1, size=(num_new_per_technique, n_ri)) - 0.5], axis=1)
+            order = np.argsort(positions, axis=1, kind='stable')
+            expanded = np.concatenate([np.repeat(ids[None, :], num_new_per_technique, axis=0), inserted], axis=1)
+            augmented_ids.extend(np.take_along_axis(expanded, order, axis=1))
+        else:
+            augmented_ids.extend([ids] * num_new_per_technique)
+
+        # rs: swap two distinct words n times
+        swapped = np.repeat(ids[None, :], num_new_per_technique, axis=0)
+        if num_words > 1:
+            for _ in range(n_rs):
+                first = rng.integers(num_words, size=(num_new_per_technique, 1))
+                second = rng.integers(num_words - 1, size=(num_new_per_technique, 1))
+                second += second >= first
+                swapped[rows, first], swapped[rows, second] = swapped[rows, second], swapped[rows, first]
+        augmented_ids.extend(swapped)
+
+        # rd: delete each word with probability p, keeping at least one word
+        kept = rng.random((num_new_per_technique, num_words)) > self.p_rd
+        if num_words > 1:
+            empty = np.flatnonzero(~kept.any(axis=1))
+            kept[empty, rng.integers(num_words, size=len(empty))] = True
+        else:
+            kept[:] = True
+        augmented_ids.extend(ids[mask] for mask in kept)
+
+        # strings are only decoded once every operation is applied
+        augmented_sentences = [' '.join(vocabulary[a_ids]) for a_ids in augmented_ids]
+        augmented_sentences = [augmented_sentences[i] for i in rng.permutation(len(augmented_sentences))]
+
+        # trim so that we have the desired number of augmented sentences
+        if self.num_aug >= 1:
+            augmented_sentences = augmented_sentences[:self.num_aug]
+        else:
+            keep_prob = self.num_aug / len(augmented_sentences)
+            keep = rng.random(len(augmented_sentences)) < keep_prob
+            augmented_sentences = [s for s, k in zip(augmented_sentences, keep) if k]
+
+        # append the original sentence
+        augmented_sentences.append(sentence)
+
+        return augmented_sentences
+
+    def _generate_chunk(self, chunk):
+        return [self._augment(sentence, self._get_rng(index)) for index, sentence in chunk]
+
+    def generate(self, sentence, index=0):
+        """ Augment `sentence` as the `index`-th sentence of a stream
+        """
+        return self._augment(sentence, self._get_rng(index))
+
+    def iter_generate(self, sentences, start=0):
+        """
+        :param start: index of the first of `sentences` in the whole stream (e.g. the number of sentences augmented
+                      by earlier calls), so that a stream augmented in several calls gets the same random streams as
+                      if it was augmented in a single call
+        """
+        sentences = enumerate(sentences, start)
+        while True:
+            # only a few chunks per worker are read ahead, so memory stays bounded on arbitrarily long streams
+            chunks = []
+            for _ in range(max(1, self.workers) * _CHUNKS_PER_WORKER):
+                chunk = list(itertools.islice(sentences, _CHUNK_SIZE))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            if not chunks:
+                return
+
+            if self.workers > 1:
+                generated = self._get_pool().imap(_generate_in_worker, chunks)
+            else:
+                generated = map(self._generate_chunk, chunks)
+
+            # `imap` yields in input order and every sentence has its own random stream, so the results are
+            # identical to the serial path
+            for chunk, chunk_results in zip(chunks, generated):
+                for (_, sentence), augmented_sentences in zip(chunk, chunk_results):
+                    yield sentence, augmented_sentences
+
+    def batch_generate(self, sentences):
+        return dict(tqdm(self.iter_generate(sentences), total=len(sentences)))
@@ -0,0 +1,32 @@
+from qgen.util import nlp
+
+
+class QuestionAnalysis:
+    """ Intermediate results of fuzzy pattern matching for a single input question.
+
+    The spaCy docs needed along the way (for splitting the question, resolving follow-up questions, locating verbs and
+    verifying subjects) are parsed in batches by `FPMGenerator._analyse` and pinned here, so each text is parsed once
+    and shared by every step that looks at it. Likewise, the coreference clusters of a sub-question are computed once
+    and reused by all the generated questions that drop its statement.
+    """
+
+    def __init__(self, question, text, has_multiple_question):
+        """
+        :param question: original input question
+        :param text: question after formatting and contraction conversion
+        :param has_multiple_question: whether `text` contains multiple sub-questions
+        """
+        self.question = question
+        self.text = text
+        self.has_multiple_question = has_multiple_question
+
+        self.sub_questions = []
+        self.matches = []  # `MatchedResult` (or None) of each sub-question
+        self.docs = dict()  # text -> spaCy doc
+        self.coref_docs = dict()  # context -> NeuralCoref doc
+
+    def get_doc(self, text):
+        """ Returns the spaCy doc of `text` pinned on the analysis, or the (cached) doc parsed on demand otherwise
+        """
+        doc = self.docs.get(text)
+        return nlp.get_spacy_doc(text) if doc is None else doc
@@ -1,11 +1,19 @@
+import hashlib
 import itertools
+import json
+import multiprocessing
+import os
+import pickle
 import string
+from collections import namedtuple
 
 from tqdm import tqdm
 
 from qgen.util import nlp
+from .analysis import QuestionAnalysis
 from .matcher import FuzzyMatcher
-from .pattern import pattern_specs
+from .pattern import TOKENS as SPECIAL_TOKENS, pattern_specs
+from .template import PatternTemplate
 from ..base import BaseGenerator
 
 # 5W1H
@@ -13,22 +21,81 @@ WH = {'who', 'what', 'why', 'where', 'when', 'how'}
 # Coordinating conjunction
 FANBOYS = {'for', 'and', 'nor', 'but', 'or', 'yet', 'so'}
 
+# Bump whenever the layout of the cached patterns or of `FuzzyMatcher` changes
+_ARTIFACT_VERSION = 2
+
+# Number of questions analysed together (and sent to a worker process at a time)
+_CHUNK_SIZE = 64
+# Number of chunks read ahead per worker process when streaming
+_CHUNKS_PER_WORKER = 4
+
+_worker_generator = None  # generator owned by a worker process of `FPMGenerator.batch_generate`
+
+# Tokens extracted from a matched sub-question (`sentence`), to be filled into the other patterns of its group
+MatchedSlots = namedtuple('MatchedSlots', ['sentence', 'group_id', 'pattern', 'tokens'])
+
+
+def _init_worker(cache_dir, doc_cache_size, doc_cache_bytes):
+    global _worker_generator
+    _worker_generator = FPMGenerator(cache_dir, doc_cache_size=doc_cache_size, doc_cache_bytes=doc_cache_bytes)
+    nlp.get_spacy_model()
+
+
+def _generate_in_worker(sentences):
+    return _worker_generator._generate_chunk(sentences)
+
+
+def _match_in_worker(sentences):
+    return _worker_generator._match_chunk(sentences)
+
 
 class FPMGenerator(BaseGenerator):
     """ Generate questions via fuzzy pattern matching on existing question patterns. """
 
-    def __init__(self):
+    def __init__(self, cache_dir=None, workers=1, doc_cache_size=nlp.DOC_CACHE_SIZE,
+                 doc_cache_bytes=nlp.DOC_CACHE_BYTES):
+        """
+        :param cache_dir: directory to store the expanded patterns and their fuzzy matcher, so that subsequent runs
+                          (and worker processes) can load them instead of rebuilding. Disabled if None.
+        :param workers: number of worker processes used by `batch_generate`
+        :param doc_cache_size: maximum number of spaCy docs kept in memory by each process, unbounded if None
+        :param doc_cache_bytes: maximum estimated size of the cached spaCy docs in bytes, unbounded if None
+        """
         super().__init__("Fuzzy Question Pattern Matching")
 
-        self.patterns = self._generate_patterns(pattern_specs)
-        self.matcher = FuzzyMatcher(self.patterns)
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.doc_cache_size = doc_cache_size
+        self.doc_cache_bytes = doc_cache_bytes
+        nlp.configure_doc_cache(doc_cache_size, doc_cache_bytes)
+        self.patterns, self.matcher = self._load_patterns(pattern_specs, cache_dir)
+        self.templates = [[PatternTemplate(pattern) for pattern in group] for group in self.patterns]
+        # groups in which a matched <st> may be dropped by another pattern, requiring coreference resolution
+        self._coref_groups = {group_id for group_id, group in enumerate(self.templates)
+                              if any(template.counts['<st>'] == 0 for template in group)}
+        self._pool = None
+
+    def _get_pool(self):
+        # the pool is kept across batches so that every worker loads the patterns and spaCy model only once
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                              initargs=(self.cache_dir, self.doc_cache_size, self.doc_cache_bytes))
+
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
 
     @staticmethod
     def _generate_patterns(specs):
         patterns = []
         for group in specs:
-            for _ in range(len(group['patterns'])):  # iterate through all original patterns
-                pattern = group['patterns'].pop(0).strip()
+            group_patterns = []
+            for pattern in group['patterns']:  # iterate through all original patterns
+                pattern = pattern.strip()
                 tokens_list = []  # list of tokens that require substitution
                 for word in pattern.split():
                     if word.startswith('{') and word.endswith('}'):
@@ -39,12 +106,37 @@ class FPMGenerator(BaseGenerator):
                         curr_pattern = temp.pop(0)
                         for substitute in group['substitution_keys'][token]:
                             temp.append(curr_pattern.replace('{' + token + '}', substitute))
-                group['patterns'].extend(temp)
+                group_patterns.extend(temp)
 
-            patterns.append(group['patterns'])
+            patterns.append(group_patterns)
 
         return patterns
 
+    @staticmethod
+    def _load_patterns(specs, cache_dir=None):
+        """ Return expanded patterns and their `FuzzyMatcher`, reusing the artifact in `cache_dir` built from the
+            same `specs` if there is one.
+        """
+        if cache_dir is None:
+            patterns = FPMGenerator._generate_patterns(specs)
+            return patterns, FuzzyMatcher(patterns)
+
+        key = hashlib.sha1(json.dumps([_ARTIFACT_VERSION, specs], sort_keys=True).encode('utf-8')).hexdigest()
+        path = os.path.join(cache_dir, f"fpm-{key}.pkl")
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+
+        patterns = FPMGenerator._generate_patterns(specs)
+        matcher = FuzzyMatcher(patterns)
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump((patterns, matcher), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)  # atomic, so concurrent processes never read a partial artifact
+
+        return patterns, matcher
+
     @staticmethod
     def _format_input(sentence):
         """ Add a space after specific punctuation if it is not followed by a space
@@ -77,10 +169,8 @@ class FPMGenerator(BaseGenerator):
             return any([c in question.lower() for c in itertools.chain.from_iterable(combined_wh)])
 
     @staticmethod
-    def _split_question(question):
-        spacy_nlp = nlp.get_spacy_model()
-
-        def _resolve_followup_question(prev_question, followup_question):
+    def _split_question(question, get_doc=nlp.get_spacy_doc):
+        def _resolve_followup_question(prev_question, prev_tokens, followup_question):
             """ Resolve sentences start with "If so", "If not", etc.
             """
             sub_question_lower = followup_question.lower()
@@ -88,17 +178,16 @@ class FPMGenerator(BaseGenerator):
                 last_aux_index = -1
                 last_sub_index = -1
                 index = 0
-                with spacy_nlp.disable_pipes('ner'):
-                    for token in spacy_nlp(prev_question):
-                        if token.dep_ == 'aux':
-                            last_aux_index = index
-                        elif token.dep_ in ['nsubj', 'nsubjpass']:
-                            last_sub_index = index
-                        elif token.dep_ == 'ROOT':
-                            break
-
-                        if token.dep_ not in ['case', 'punct']:
-                            index += 1
+                for token in prev_tokens:
+                    if token.dep_ == 'aux':
+                        last_aux_index = index
+                    elif token.dep_ in ['nsubj', 'nsubjpass']:
+                        last_sub_index = index
+                    elif token.dep_ == 'ROOT':
+                        break
+
+                    if token.dep_ not in ['case', 'punct']:
+                        index += 1
 
                 tokens = prev_question.rstrip(".!?, ").split()
                 sub = " ".join(tokens[last_aux_index + 1:last_sub_index + 1])
@@ -116,20 +205,20 @@ class FPMGenerator(BaseGenerator):
             return [question]
 
         result = []
-        with spacy_nlp.disable_pipes('ner'):
-            doc = spacy_nlp(question)
-
-            for sent in doc.sents:
-                # remove leading coordinating conjunction
-                for cc in FANBOYS:
-                    if sent.text.lower().startswith(cc):
-                        result.append(sent.text[len(cc) + 1:])
-                        break
+        sents = list(get_doc(question).sents)
+        for sent in sents:
+            # remove leading coordinating conjunction
+            for cc in FANBOYS:
+                if sent.text.lower().startswith(cc):
+                    result.append(sent.text[len(cc) + 1:])
+                    break
+            else:
+                if len(result) >= 1 and any(sent.text.lower().startswith(pre) for pre in ['if so', 'if not']):
+                    # reuse the tokens of the first sentence unless its leading conjunction was removed
+                    prev_tokens = sents[0] if result[0] == sents[0].text else get_doc(result[0])
+                    result.append(_resolve_followup_question(result[0], prev_tokens, sent.text))
                 else:
-                    if len(result) >= 1 and any(sent.text.lower().startswith(pre) for pre in ['if so', 'if not']):
-                        result.append(_resolve_followup_question(result[0], sent.text))
-                    else:
-                        result.append(sent.text)
+                    result.append(sent.text)
 
         context = ""
         combined_wh = [["{} and {}".format(w1, w2), "{} & {}".format(w1, w2)] for w1 in WH for w2 in WH]
@@ -156,69 +245,138 @@ class FPMGenerator(BaseGenerator):
         return results
 
     @staticmethod
-    def _preprocess(question):
-        # 1. Convert contraction to regular form (e.g. "What's" to "What is")
-        question = nlp.convert_contraction(FPMGenerator._format_input(question).strip())
+    def _normalize_question(question):
+        # Convert contraction to regular form (e.g. "What's" to "What is")
+        return nlp.convert_contraction(FPMGenerator._format_input(question).strip())
 
-        # 2. Separate multiple questions from sentence
-        sentences = [question]
-        if FPMGenerator._has_multiple_question(question):
-            sentences = FPMGenerator._split_question(question)
+    def _analyse(self, questions):
+        """ Return a `QuestionAnalysis` for each of `questions`. Texts that need to be parsed by spaCy are parsed
+            in batches, once for all the steps and all the questions.
+        """
+        analyses = []
+        for question in questions:
+            text = self._normalize_question(question)
+            analyses.append(QuestionAnalysis(question, text, self._has_multiple_question(text)))
+
+        # 1. Separate multiple questions from sentence
+        multiple = [a for a in analyses if a.has_multiple_question]
+        for a, doc in zip(multiple, nlp.get_spacy_docs([a.text for a in multiple])):
+            a.docs[a.text] = doc
+        for a in analyses:
+            a.sub_questions = self._split_question(a.text, a.get_doc) if a.has_multiple_question else [a.text]
+
+        # 2. Extract question patterns
+        for a in analyses:
+            a.matches = [self.matcher.match(sentence) for sentence in a.sub_questions]
+
+        # 3. Parse everything needed to resolve the tokens of the matched patterns
+        texts = [(a, text) for a in analyses for m in a.matches if m for text in m.get_required_texts()]
+        for (a, text), doc in zip(texts, nlp.get_spacy_docs([text for _, text in texts])):
+            a.docs[text] = doc
+        for a in analyses:
+            for m in a.matches:
+                if m:
+                    m.get_doc = a.get_doc
+
+        # 4. Run coreference resolution once per sub-question that may need it, in a single batch
+        contexts = [(a, sentence) for a in analyses for sentence, m in zip(a.sub_questions, a.matches)
+                    if m and '<st>' in m.pattern and m.group_id in self._coref_groups]
+        for (a, context), doc in zip(contexts, nlp.get_coref_docs([context for _, context in contexts])):
+            a.coref_docs[context] = doc
+
+        return analyses
 
-        return sentences
+    @staticmethod
+    def _get_slots(analysis):
+        """ Returns the `MatchedSlots` of each matched sub-question of `analysis`
+        """
+        slots = []
+        for sentence, matched_result in zip(analysis.sub_questions, analysis.matches):
+            if not matched_result:
+                continue
 
-    def generate(self, sentence):
-        inputs = self._preprocess(sentence)
+            tokens = {token: list(matched_result.tokens[token]) for token in SPECIAL_TOKENS}
+            if len(tokens['<st>']) > 1:
+                # concatenate multiple statements into single statement
+                tokens['<st>'] = [' and '.join(tokens['<st>']).translate(str.maketrans('', '', string.punctuation))]
+            slots.append(MatchedSlots(sentence, matched_result.group_id, matched_result.pattern, tokens))
 
+        return slots
+
+    def fill_slots(self, slots, coref_docs=None):
+        """ Returns the questions generated by filling the tokens of each of `slots` into the other patterns of its
+        group
+
+        :param slots: list of `MatchedSlots`, as yielded by `iter_matches`
+        :param coref_docs: dictionary mapping each sub-question to its NeuralCoref doc, if it was already computed
+        """
+        coref_docs = coref_docs or dict()
         result = []
-        for sentence in inputs:
-            # Extract question pattern
-            matched_result = self.matcher.match(sentence)
+        for sentence, group_id, pattern, tokens in slots:
+            # Substitute tokens into other question patterns
+            matched_pattern = pattern.lower()
+            for template in self.templates[group_id]:
+                if template.lower == matched_pattern:
+                    continue
+                if template.accepts(tokens):
+                    # Coreference resolution (i.e. Find out what 'it' in a sentence is referring to)
+                    permuted = template.fill(tokens)
+                    if tokens['<st>'] and template.counts['<st>'] == 0:
+                        result.append(self._format_output(
+                            nlp.resolve_coref(permuted, sentence, coref_docs.get(sentence)))
+                        )
+                    else:
+                        result.append(self._format_output(permuted))
 
-            if not matched_result:
-                continue
-            else:
-                tokens = matched_result.tokens
-                if len(tokens['<st>']) > 1:
-                    # concatenate multiple statements into single statement
-                    tokens['<st>'] = [
-                        ' and '.join(tokens['<st>']).translate(str.maketrans('', '', string.punctuation))]
-
-                # Substitute tokens into other question patterns
-                patterns_list = self.patterns[matched_result.group_id]
-                for pattern in patterns_list:
-                    if pattern.lower() == matched_result.pattern.lower():
-                        continue
-                    pattern_tokens = pattern.split()
-                    if (len(tokens['<sbj>']) == pattern_tokens.count('<sbj>') and
-                            len(tokens['<obj>']) >= pattern_tokens.count('<obj>') and
-                            len(tokens['<act>']) == pattern_tokens.count('<act>') and
-                            len(tokens['<st>']) >= pattern_tokens.count('<st>')):
-                        for i in range(pattern_tokens.count('<obj>')):
-                            pattern_tokens[pattern_tokens.index('<obj>')] = tokens['<obj>'][i].strip('?')
-                        for i in range(pattern_tokens.count('<sbj>')):
-                            pattern_tokens[pattern_tokens.index('<sbj>')] = tokens['<sbj>'][i].strip('?')
-                        for i in range(pattern_tokens.count('<act>')):
-                            pattern_tokens[pattern_tokens.index('<act>')] = tokens['<act>'][i].strip('?')
-                        for i in range(pattern_tokens.count('<st>')):
-                            pattern_tokens[pattern_tokens.index('<st>')] = tokens['<st>'][i].strip('?')
-
-                        # Coreference resolution (i.e. Find out what 'it' in a sentence is referring to)
-                        permuted = ' '.join(pattern_tokens)
-                        if tokens['<st>'] and pattern.split().count('<st>') == 0:
-                            result.append(self._format_output(
-                                nlp.resolve_coref(permuted, sentence))
-                            )
-                        else:
-                            result.append(self._format_output(permuted))
-
-                result = list(set(result).difference({sentence}))
+            # remove duplicates while keeping the output order identical across processes
+            result = [r for r in dict.fromkeys(result) if r != sentence]
 
         return result
 
-    def batch_generate(self, sentences):
-        results = dict()
-        for sentence in tqdm(sentences):
-            results[sentence] = self.generate(sentence)
+    def _generate_from_analysis(self, analysis):
+        return self.fill_slots(self._get_slots(analysis), analysis.coref_docs)
 
-        return results
+    def _generate_chunk(self, sentences):
+        return [self._generate_from_analysis(analysis) for analysis in self._analyse(sentences)]
+
+    def _match_chunk(self, sentences):
+        return [(self._generate_from_analysis(analysis), self._get_slots(analysis))
+                for analysis in self._analyse(sentences)]
+
+    def generate(self, sentence):
+        return self._generate_chunk([sentence])[0]
+
+    def _iter_chunks(self, sentences, process_chunk, process_in_worker):
+        sentences = iter(sentences)
+        while True:
+            # only a few chunks per worker are read ahead, so memory stays bounded on arbitrarily long streams
+            chunks = []
+            for _ in range(max(1, self.workers) * _CHUNKS_PER_WORKER):
+                chunk = list(itertools.islice(sentences, _CHUNK_SIZE))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            if not chunks:
+                return
+
+            if self.workers > 1:
+                processed = self._get_pool().imap(process_in_worker, chunks)
+            else:
+                processed = map(process_chunk, chunks)
+
+            # `imap` yields in input order, so the results are merged exactly as in the serial path
+            for chunk, chunk_results in zip(chunks, processed):
+                yield from zip(chunk, chunk_results)
+
+    def iter_generate(self, sentences):
+        return self._iter_chunks(sentences, self._generate_chunk, _generate_in_worker)
+
+    def iter_matches(self, sentences):
+        """ Same as `iter_generate`, except that the questions generated from each sentence come with the
+        `MatchedSlots` of its sub-questions, so that their tokens can be filled again with `fill_slots`
+        """
+        for sentence, (questions, slots) in self._iter_chunks(sentences, self._match_chunk, _match_in_worker):
+            yield sentence, questions, slots
+
+    def batch_generate(self, sentences):
+        return dict(tqdm(self.iter_generate(sentences), total=len(sentences)))
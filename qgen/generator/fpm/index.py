@@ -0,0 +1,115 @@
+import re
+from collections import defaultdict
+
+from .pattern import TOKENS as SPECIAL_TOKENS
+
+_TOKENS_REGEX = re.compile("|".join(re.escape(token) for token in SPECIAL_TOKENS))
+_ESCAPED_SPACE = re.escape(' ')
+
+# anchors of a literal piece
+_FLOATING = 0  # may appear anywhere in the sentence
+_START = 1  # offset is counted from the start of the sentence
+_END = 2  # offset is counted from the end of the sentence
+
+
+def _split_evenly(text, n):
+    size, remainder = divmod(len(text), n)
+    pieces = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < remainder else 0)
+        pieces.append((start, text[start:end]))
+        start = end
+
+    return pieces
+
+
+class PatternIndex:
+    """ Pre-filtering index that selects the patterns which can possibly match a sentence.
+
+    Each literal part of a fuzzy pattern tolerates at most `max_errors` edits, so when the part is cut into
+    `max_errors + 1` disjoint pieces, at least one piece must appear verbatim (ignoring case) in any matching sentence.
+    Parts at the beginning or the end of a pattern are anchored by the full match, hence their pieces must also appear
+    within `max_errors` characters of their expected offset. A pattern is a candidate only if every literal part has
+    at least one of its pieces present in the sentence.
+    """
+
+    def __init__(self, patterns, max_errors):
+        """
+        :param patterns: list of patterns, in the same syntax as `pattern_specs`
+        :param max_errors: maximum number of edits allowed in each literal part of a pattern
+        """
+        self.max_errors = max_errors
+
+        piece_ids = dict()
+        signatures = defaultdict(list)  # literal requirements of a pattern -> pattern indices
+        for i, pattern in enumerate(patterns):
+            requirements = set()
+            for literal, anchor, offset in self._get_literal_parts(pattern):
+                pieces = set()
+                for piece_offset, piece in _split_evenly(literal, max_errors + 1):
+                    piece_id = piece_ids.setdefault(piece.casefold(), len(piece_ids))
+                    if anchor == _START:
+                        pieces.add((piece_id, anchor, offset + piece_offset))
+                    elif anchor == _END:
+                        pieces.add((piece_id, anchor, offset + len(literal) - piece_offset - len(piece)))
+                    else:
+                        pieces.add((piece_id, anchor, 0))
+                requirements.add(tuple(sorted(pieces)))
+            signatures[tuple(sorted(requirements))].append(i)
+
+        self.pieces = list(piece_ids.keys())
+        self.signatures = list(signatures.items())
+
+    def _get_literal_parts(self, pattern):
+        """ Return (literal, anchor, offset) of each literal part of `pattern` that is long enough to be filtered on.
+        """
+        segments = _TOKENS_REGEX.split(pattern)
+        literals = []
+        for i, segment in enumerate(segments):
+            literal = segment.strip(' ')
+            # only keep parts that are translated verbatim into a fuzzy group by `FuzzyMatcher`
+            if re.escape(segment).strip(_ESCAPED_SPACE) != re.escape(literal):
+                continue
+            if len(literal) <= self.max_errors:
+                continue
+
+            if i == 0:
+                literals.append((literal, _START, len(segment) - len(segment.lstrip(' '))))
+            elif i == len(segments) - 1:
+                literals.append((literal, _END, len(segment) - len(segment.rstrip(' '))))
+            else:
+                literals.append((literal, _FLOATING, 0))
+
+        return literals
+
+    def candidates(self, sentence):
+        """ Return sorted indices of the patterns that might match `sentence`.
+        """
+        text = sentence.casefold()
+        # offsets are only meaningful if case folding preserves the length of the sentence
+        use_offsets = len(text) == len(sentence)
+        found = dict()
+
+        def is_present(piece_id, anchor, offset):
+            key = (piece_id, anchor, offset) if use_offsets else (piece_id, _FLOATING, 0)
+            if key not in found:
+                piece = self.pieces[piece_id]
+                if not use_offsets or anchor == _FLOATING:
+                    found[key] = piece in text
+                elif anchor == _START:
+                    start = max(0, offset - self.max_errors)
+                    found[key] = text.find(piece, start, offset + self.max_errors + len(piece)) != -1
+                else:
+                    end = len(text) - offset
+                    start = max(0, end - self.max_errors - len(piece))
+                    found[key] = text.find(piece, start, end + self.max_errors) != -1
+
+            return found[key]
+
+        result = []
+        for requirements, indices in self.signatures:
+            if all(any(is_present(*piece) for piece in pieces) for pieces in requirements):
+                result.extend(indices)
+
+        return sorted(result)
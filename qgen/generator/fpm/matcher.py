@@ -5,32 +5,52 @@ from itertools import product
 import regex
 
 from qgen.util import nlp
+from .index import PatternIndex
 from .pattern import TOKENS as SPECIAL_TOKENS
 
-_spacy_docs_cache = dict()
+_MAX_ERRORS = 3
 
 
 class MatchedResult:
     def __init__(self, group_id, pattern, match):
         self.group_id = group_id
         self.pattern = pattern
+        self.match = match
         self.fuzzy_counts = sum(match.fuzzy_counts)
-        self.tokens = self._parse_tokens(match.string, pattern, match)
+        # returns the spaCy doc of a text, replaced by the docs parsed ahead when the match is part of a batch
+        self.get_doc = nlp.get_spacy_doc
+        self._tokens = None
 
-    @staticmethod
-    def _get_spacy_doc(sentence):
-        spacy_nlp = nlp.get_spacy_model()
-        if sentence not in _spacy_docs_cache:
-            with spacy_nlp.disable_pipes('ner'):
-                _spacy_docs_cache[sentence] = spacy_nlp(sentence)
+    @property
+    def tokens(self):
+        # parsing requires spaCy, so it is deferred until the tokens of the best match are actually needed
+        if self._tokens is None:
+            self._tokens = self._parse_tokens(self.match.string, self.pattern, self.match, self.get_doc)
+
+        return self._tokens
+
+    def get_required_texts(self):
+        """ Return the texts that will be parsed by spaCy when the tokens are resolved, so that they can be parsed
+            ahead in a batch.
+        """
+        sentence = self.match.string
+        texts = []
+        if "<sbj> <act>" in self.pattern or "<obj> <act>" in self.pattern:
+            texts.append(sentence)
+        if "<sbj>" in self.pattern:
+            texts.append(self._normalize_for_subj(sentence))
+
+        return texts
 
-        return _spacy_docs_cache[sentence]
+    @staticmethod
+    def _normalize_for_subj(sentence):
+        return " ".join(nlp.replace_punct(sentence, replace_with=" ", ignore_list="-").strip().split())
 
     @staticmethod
-    def _get_first_verb_offset(sentence, starting_offset=0):
+    def _get_first_verb_offset(sentence, starting_offset=0, get_doc=nlp.get_spacy_doc):
         """ Return character offset for the first encountered verb
         """
-        doc = MatchedResult._get_spacy_doc(sentence)
+        doc = get_doc(sentence)
         for token in doc:
             if token.idx < starting_offset:
                 continue
@@ -43,14 +63,14 @@ class MatchedResult:
         return -1
 
     @staticmethod
-    def _is_subj(sentence, substr):
+    def _is_subj(sentence, substr, get_doc=nlp.get_spacy_doc):
         """ Returns True if `substr` in `sentence` is a noun chunk and its syntactic dependency tag is nominal subject
         """
         # remove punctuations to make things easier
-        sentence = " ".join(nlp.replace_punct(sentence, replace_with=" ", ignore_list="-").strip().split())
-        substr = " ".join(nlp.replace_punct(substr, replace_with=" ", ignore_list="-").strip().split())
+        sentence = MatchedResult._normalize_for_subj(sentence)
+        substr = MatchedResult._normalize_for_subj(substr)
 
-        doc = MatchedResult._get_spacy_doc(sentence)
+        doc = get_doc(sentence)
         temp = []
         sbj_tags = ['nsubj', 'nsubjpass']
         previous_dep = None
@@ -72,7 +92,7 @@ class MatchedResult:
         return False
 
     @staticmethod
-    def _parse_tokens(sentence, pattern, match):
+    def _parse_tokens(sentence, pattern, match, get_doc=nlp.get_spacy_doc):
         tokens = defaultdict(list)
         for t in SPECIAL_TOKENS:
             if t in pattern:
@@ -88,7 +108,7 @@ class MatchedResult:
 
             for pair in unresolved:
                 sub_sentence = " ".join(pair)
-                verb_offset = MatchedResult._get_first_verb_offset(sentence, sentence.index(sub_sentence))
+                verb_offset = MatchedResult._get_first_verb_offset(sentence, sentence.index(sub_sentence), get_doc)
                 if verb_offset == -1:
                     tokens = defaultdict(list)
                     break
@@ -108,20 +128,46 @@ class MatchedResult:
 
         # Verify <sbj> tokens
         for sbj in tokens['<sbj>']:
-            if not MatchedResult._is_subj(sentence, sbj):
+            if not MatchedResult._is_subj(sentence, sbj, get_doc):
                 tokens = defaultdict(list)
 
         return tokens
 
 
+def _get_effective_length(pattern):
+    """ Return pattern length without counting special tokens
+    """
+    for token in SPECIAL_TOKENS:
+        pattern = pattern.replace(token, "")
+
+    return len(pattern)
+
+
 class FuzzyMatcher:
     def __init__(self, patterns):
         self.patterns = [[(pattern, self._convert_to_fuzzy_regex(pattern)) for pattern in group] for group in patterns]
 
+        # flattened view of `self.patterns`, in the same order, for the pre-filtering index
+        self.entries = [(group_id, pattern, fuzzy_regex) for group_id, group in enumerate(self.patterns)
+                        for pattern, fuzzy_regex in group]
+        self.lengths = [_get_effective_length(pattern) for _, pattern, _ in self.entries]
+        # patterns are tried from the longest to the shortest, ties are broken by their original order
+        self.order = sorted(range(len(self.entries)), key=lambda i: (-self.lengths[i], i))
+        self.index = PatternIndex([pattern for _, pattern, _ in self.entries], _MAX_ERRORS)
+        # compiled fuzzy regexes for each error budget, filled on first use
+        self.compiled = [[None] * len(self.entries) for _ in range(_MAX_ERRORS + 1)]
+
+    def __getstate__(self):
+        # compiled regexes are rebuilt from their source when unpickled, so it is cheaper to compile them lazily
+        state = self.__dict__.copy()
+        state['compiled'] = [[None] * len(self.entries) for _ in range(_MAX_ERRORS + 1)]
+
+        return state
+
     @staticmethod
-    def _convert_to_fuzzy_regex(pattern):
+    def _convert_to_fuzzy_regex(pattern, max_errors=_MAX_ERRORS):
         match_any = '.+'
-        fuzzy_rule = '{e<=3}'
+        fuzzy_rule = f'{{e<={max_errors}}}'
         ignore_case = '(?i)'
         space = re.escape(' ')
         placeholder = '<<<placeholder>>>'
@@ -147,24 +193,57 @@ class FuzzyMatcher:
 
         return fuzzy_regex
 
+    def _get_compiled_regex(self, index, max_errors=_MAX_ERRORS):
+        if self.compiled[max_errors][index] is None:
+            if max_errors == _MAX_ERRORS:
+                fuzzy_regex = self.entries[index][2]
+            else:
+                fuzzy_regex = self._convert_to_fuzzy_regex(self.entries[index][1], max_errors)
+            self.compiled[max_errors][index] = regex.compile(fuzzy_regex)
+
+        return self.compiled[max_errors][index]
+
     def match(self, sentence):
-        def get_effective_length(_pattern):
-            # get pattern length without counting special tokens
-            _pattern = _pattern.replace("<sbj>", "")
-            _pattern = _pattern.replace("<obj>", "")
-            _pattern = _pattern.replace("<act>", "")
-            _pattern = _pattern.replace("<st>", "")
-
-            return len(_pattern)
-
-        candidates = []
-        for group_id, group in enumerate(self.patterns):
-            for pattern, fuzzy_regex in group:
-                match = regex.fullmatch(fuzzy_regex, sentence.strip("?"))
-                if match is not None:
-                    candidates.append(MatchedResult(group_id, pattern, match))
-
-        # sort by least fuzzy count, then by most pattern length
-        candidates.sort(key=lambda x: (x.fuzzy_counts, -get_effective_length(x.pattern)))
-
-        return candidates[0] if len(candidates) > 0 else None
+        """ Return the `MatchedResult` with the least fuzzy count, then with the longest pattern, as a scan of every
+        pattern under `{e<=_MAX_ERRORS}` would (ties go to the earlier pattern).
+
+        Patterns are searched best-first: every error budget from 0 to `_MAX_ERRORS` is tried in turn, each time
+        from the longest pattern to the shortest. The budgets only bound the fuzzy counts from below (a pattern that
+        failed under a budget needs at least one more error under the next one), so a pattern matched under any budget
+        is ranked and captured by its `{e<=_MAX_ERRORS}` match, and the search stops as soon as no remaining pattern
+        can beat the best match so far.
+        """
+        sentence = sentence.strip("?")
+        candidates = set(self.index.candidates(sentence))
+        remaining = [i for i in self.order if i in candidates]
+
+        best = None  # (fuzzy counts, negative effective length, pattern index, match)
+        for max_errors in range(_MAX_ERRORS + 1):
+            unmatched = []
+            for i in remaining:
+                # lowest possible rank of pattern `i`, since it needs at least `max_errors` errors to match
+                if best is not None and (max_errors, -self.lengths[i], i) >= best[:3]:
+                    remaining = []
+                    break
+
+                match = self._get_compiled_regex(i, max_errors).fullmatch(sentence)
+                if match is None:
+                    unmatched.append(i)
+                    continue
+
+                if max_errors < _MAX_ERRORS:
+                    # the alignment found under a tighter budget may differ, so it is neither ranked nor captured
+                    match = self._get_compiled_regex(i).fullmatch(sentence)
+                if best is None or (sum(match.fuzzy_counts), -self.lengths[i], i) < best[:3]:
+                    best = (sum(match.fuzzy_counts), -self.lengths[i], i, match)
+            else:
+                remaining = unmatched
+
+            if not remaining:
+                break
+
+        if best is None:
+            return None
+
+        group_id, pattern, _ = self.entries[best[2]]
+        return MatchedResult(group_id, pattern, best[3])
@@ -0,0 +1,36 @@
+from .pattern import TOKENS as SPECIAL_TOKENS
+
+
+class PatternTemplate:
+    """ Pattern pre-tokenized for slot filling.
+
+    Slot positions and slot counts are computed once, so filling a template is a single pass over its words.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.lower = pattern.lower()
+        self.words = pattern.split()
+        self.slots = [(i, word) for i, word in enumerate(self.words) if word in SPECIAL_TOKENS]
+        self.counts = {token: 0 for token in SPECIAL_TOKENS}
+        for _, token in self.slots:
+            self.counts[token] += 1
+
+    def accepts(self, tokens):
+        """ Returns True if the extracted `tokens` are enough to fill every slot of the template
+        """
+        return (len(tokens['<sbj>']) == self.counts['<sbj>'] and
+                len(tokens['<obj>']) >= self.counts['<obj>'] and
+                len(tokens['<act>']) == self.counts['<act>'] and
+                len(tokens['<st>']) >= self.counts['<st>'])
+
+    def fill(self, tokens):
+        """ Substitute the n-th occurrence of each slot with the n-th extracted token of the same type
+        """
+        words = self.words.copy()
+        occurrences = {token: 0 for token in SPECIAL_TOKENS}
+        for i, token in self.slots:
+            words[i] = tokens[token][occurrences[token]].strip('?')
+            occurrences[token] += 1
+
+        return ' '.join(words)
@@ -0,0 +1,95 @@
+import re
+from itertools import tee
+
+from tqdm import tqdm
+
+from .base import BaseGenerator
+
+
+def _compile_replacements(replacements):
+    # longer words first, so that a word is never replaced by a shorter word it contains
+    words = sorted(replacements, key=len, reverse=True)
+    return re.compile('|'.join(r'(?<!\w)' + re.escape(word) + r'(?!\w)' for word in words), re.IGNORECASE)
+
+
+def _project(text, pattern, replacements):
+    """ Replace the words of `text` (a token extracted from a source question) that were substituted in a variant of
+    the source question with their synonyms.
+    """
+    def _replace(match):
+        synonym = replacements[match.group().lower()]
+        return synonym[0].upper() + synonym[1:] if match.group()[0].isupper() else synonym
+
+    return pattern.sub(_replace, text)
+
+
+class HybridGenerator(BaseGenerator):
+    """ Generate questions via fuzzy pattern matching on the synonym-substituted variants of the input questions.
+
+    Synonym substitution keeps the syntactic structure of a question, so pattern matching only runs on the original
+    questions: the words substituted in each variant are projected onto the tokens extracted from its original, which
+    are then filled into the same patterns.
+    Both generators stream over the input questions side by side (each with its own worker processes, if any), and the
+    questions generated from each source are deduplicated as they are projected.
+    """
+
+    def __init__(self, fpm_generator, symsub_generator, max_outputs=None):
+        """
+        :param fpm_generator: `FPMGenerator` applied to the input questions
+        :param symsub_generator: `SymSubGenerator` providing the synonym-substituted variants of the input questions
+        :param max_outputs: maximum number of distinct questions generated from each input question, unbounded if None
+        """
+        super().__init__("Hybrid mode (FPM + SymSub)")
+
+        self.fpm = fpm_generator
+        self.symsub = symsub_generator
+        self.max_outputs = max_outputs
+
+    def close(self):
+        self.fpm.close()
+        self.symsub.close()
+
+    def generate(self, sentence):
+        return next(self.iter_generate([sentence]))[1]
+
+    def _merge(self, questions, slots, variants):
+        """ Returns the distinct questions generated from a source question, up to `max_outputs`
+
+        :param questions: questions generated by FPM from the source question
+        :param slots: `MatchedSlots` of the sub-questions of the source question
+        :param variants: (variant, replacements) pairs generated by SymSub from the source question
+        """
+        results = list(dict.fromkeys(questions))[:self.max_outputs]
+        seen = set(results)
+        for _, replacements in variants:
+            if self.max_outputs is not None and len(results) >= self.max_outputs:
+                break
+
+            pattern = _compile_replacements(replacements)
+            replacements = {word.lower(): synonym for word, synonym in replacements.items()}
+            # only the tokens are projected, the words of the patterns they are filled into are kept as they are
+            projected_slots = [
+                s._replace(tokens={token: [_project(text, pattern, replacements) for text in texts]
+                                   for token, texts in s.tokens.items()})
+                for s in slots
+            ]
+            for projected in self.fpm.fill_slots(projected_slots):
+                if projected not in seen:
+                    seen.add(projected)
+                    results.append(projected)
+                    if self.max_outputs is not None and len(results) >= self.max_outputs:
+                        break
+
+        return results
+
+    def iter_generate(self, sentences):
+        # both generators yield in input order and only read a few batches ahead, so `tee` buffers a bounded number
+        # of questions between them
+        fpm_sentences, symsub_sentences = tee(sentences)
+        matched = self.fpm.iter_matches(fpm_sentences)
+        substituted = self.symsub.iter_substitutions(symsub_sentences)
+        for (sentence, questions, slots), (_, variants) in zip(matched, substituted):
+            yield sentence, self._merge(questions, slots, variants)
+
+    def batch_generate(self, sentences):
+        return dict(tqdm(self.iter_generate(sentences), total=len(sentences)))
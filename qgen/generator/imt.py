@@ -1,5 +1,6 @@
 import codecs
 import importlib
+import itertools
 import os
 import sys
 
@@ -37,13 +38,15 @@ class IMTGenerator(BaseGenerator):
         return build_translator(opt, report_score=False, out_file=codecs.open(os.devnull, "w", "utf-8"))
 
     def generate(self, sentence):
-        return list(self.batch_generate([sentence]).values())[0]
-
-    def batch_generate(self, sentences):
-        _, translation_result = self.translator.translate(sentences, batch_size=_BATCH_SIZE)
-
-        results = dict()
-        for i, rewrites in enumerate(translation_result):
-            results[sentences[i]] = rewrites
-
-        return results
+        return next(self.iter_generate([sentence]))[1]
+
+    def iter_generate(self, sentences):
+        sentences = iter(sentences)
+        while True:
+            batch = list(itertools.islice(sentences, _BATCH_SIZE))
+            if not batch:
+                return
+
+            _, translation_result = self.translator.translate(batch, batch_size=_BATCH_SIZE)
+            for i, rewrites in enumerate(translation_result):
+                yield batch[i], rewrites
@@ -1,5 +1,10 @@
+import multiprocessing
+import operator
+import random
 import string
-from itertools import product
+from collections import Counter, namedtuple
+from functools import reduce
+from itertools import combinations, islice, product
 
 import numpy as np
 from nltk.corpus import stopwords
@@ -8,147 +13,463 @@ from tqdm import tqdm
 
 from .base import BaseGenerator
 from ..util.nlp import get_spacy_model
+from ..util.wordnet import SenseCache, get_extended_gloss
+
+# Number of questions whose word senses are disambiguated together (and sent to a worker process at a time)
+_BATCH_SIZE = 32
+# Number of batches read ahead per worker process when streaming
+_BATCHES_PER_WORKER = 4
+# Maximum number of texts per call to the encoder
+_ENCODER_BATCH_SIZE = 512
+
+_SAMPLING_POLICIES = ['all', 'uniform', 'top-k', 'single']
+
+_stopwords = None
+_worker_generator = None  # generator owned by a worker process of `SymSubGenerator.iter_generate`
+
+# Candidate sense of a word: key, count and lemma names of the WordNet lemma, and extended gloss to weightage map
+Sense = namedtuple('Sense', ['key', 'count', 'lemma_names', 'extended_gloss'])
+
+
+def _get_stopwords():
+    global _stopwords
+    if _stopwords is None:
+        _stopwords = frozenset(stopwords.words('english'))
+
+    return _stopwords
+
+
+def _iter_subsets_by_rank(scores):
+    """ Yields the non-empty subsets of indices of `scores`, so that lower-scored indices are added last: all the
+    subsets of the k highest-scored indices come before any subset holding the (k+1)-th one. Subsets that add the same
+    index are yielded from the smallest to the largest.
+    """
+    ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    for k, index in enumerate(ranked):
+        for size in range(k + 1):
+            for others in combinations(ranked[:k], size):
+                yield sorted(others + (index,))
+
+
+def _coalesce_ready(results):
+    """ Yields the extractions of the batches of `results` (an ordered iterator of `Pool.imap`) merged with those of the
+    following batches that are already extracted, up to about `_ENCODER_BATCH_SIZE` words to disambiguate, so that the
+    main process disambiguates the words of several worker batches at once.
+    """
+    for extractions in results:
+        extractions = list(extractions)
+        num_requests = sum(len(candidates) for _, _, candidates in extractions)
+        while num_requests < _ENCODER_BATCH_SIZE:
+            try:
+                ready = results.next(timeout=0)
+            except (multiprocessing.TimeoutError, StopIteration):
+                break
+            extractions.extend(ready)
+            num_requests += sum(len(candidates) for _, _, candidates in ready)
+
+        yield extractions
+
+
+def _init_worker(discount_factor, sense_index):
+    global _worker_generator
+    _worker_generator = SymSubGenerator(None, discount_factor, sense_index=sense_index)
+    get_spacy_model()
+
+
+def _extract_in_worker(sentences):
+    return _worker_generator._extract_batch(sentences)
 
 
 class SymSubGenerator(BaseGenerator):
     """ Generate questions via sense-disambiguated synonyms substitution. """
 
-    def __init__(self, encoder, discount_factor=0.5, threshold=0.5):
+    def __init__(self, encoder, discount_factor=0.5, threshold=0.5, gloss_store=None, sense_index=None,
+                 max_outputs=None, sampling='all', seed=0, workers=1, decision_cache_size=0, decision_cache_path=None,
+                 decision_bits=16):
         """
         :param encoder: encoder for the computation of sentence embeddings
         :param discount_factor: discount factor for weightage calculation during word sense disambiguation (wsd)
         :param threshold: threshold value ranging from 0 to 1 for wsd score.
+        :param gloss_store: `GlossStore` of WordNet gloss embeddings precomputed with `encoder`. If given, only the
+                            input sentences (and glosses missing from the store) are embedded at runtime.
+        :param sense_index: `SenseIndex` of precomputed extended glosses. If given, the WordNet graph is only traversed
+                            for senses missing from the index.
+        :param max_outputs: maximum number of questions generated from each input question, unbounded if None
+        :param sampling: policy to choose which combinations of synonyms are generated (up to `max_outputs`):
+                         'all' enumerates every combination in order, 'uniform' samples combinations uniformly at
+                         random (requires `max_outputs`), 'top-k' substitutes the words in decreasing order of their
+                         wsd scores (every combination of the k best words comes before any combination substituting
+                         the (k+1)-th best word, fewer substitutions first) and 'single' substitutes one word at a time.
+        :param seed: random seed of the 'uniform' sampling policy
+        :param workers: number of worker processes that parse the questions and extract their candidate senses. The
+                        sentence embeddings are computed by `encoder` in the main process, once for all the worker
+                        batches extracted by then.
+        :param decision_cache_size: maximum number of wsd decisions cached in memory (unbounded if None), so that the
+                                    same word in near-duplicate sentences skips gloss scoring. Disabled if 0 (unless
+                                    `decision_cache_path` is given).
+        :param decision_cache_path: path to a sqlite database persisting the cached wsd decisions across runs
+        :param decision_bits: number of bits of the signature of the sentence embeddings in the keys of cached
+                              decisions. The more bits, the closer two sentences must be to share decisions.
         """
         super().__init__("Sense-disambiguated Synonym Substitution")
 
+        if sampling not in _SAMPLING_POLICIES:
+            raise ValueError(f"Unknown sampling policy '{sampling}', expected one of {_SAMPLING_POLICIES}")
+        if sampling == 'uniform' and max_outputs is None:
+            raise ValueError("Sampling policy 'uniform' requires max_outputs")
+        if gloss_store is not None and encoder is not None and gloss_store.encoder_name != encoder.name:
+            raise ValueError(f"Gloss store was computed with {gloss_store.encoder_name}, not {encoder.name}")
+
         self.encoder = encoder
         self.discount_factor = discount_factor
         self.threshold = threshold
+        self.gloss_store = gloss_store
+        self.sense_index = sense_index
+        self.max_outputs = max_outputs
+        self.sampling = sampling
+        self.seed = seed
+        self.workers = workers
+        self._pool = None
+        self.decision_cache = None
+        if decision_cache_size != 0 or decision_cache_path is not None:
+            self.decision_cache = SenseCache(encoder.dimension, f"{encoder.name}|{discount_factor}", decision_bits,
+                                             decision_cache_size, decision_cache_path)
 
-    def _get_best_sense_key(self, sentence, lemma, pos):
-        def _compute_weightage(main_synset, related_synset):
-            distance = main_synset.shortest_path_distance(related_synset)
-            if distance is None:
-                return 1
-            else:
-                return 1 / (1 + distance)
+    def get_decision_cache_stats(self):
+        return None if self.decision_cache is None else self.decision_cache.stats()
+
+    def _get_pool(self):
+        # the pool is kept across batches so that every worker loads the spaCy model and WordNet only once
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                              initargs=(self.discount_factor, self.sense_index))
+
+        return self._pool
 
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self.decision_cache is not None:
+            self.decision_cache.close()
+
+    def _get_senses(self, lemma, pos):
+        """ Returns the candidate `Sense`s of `lemma`
+        """
         wordnet_pos = {'VERB': wn.VERB, 'NOUN': wn.NOUN, 'ADJ': wn.ADJ, 'ADV': wn.ADV}
         if pos not in wordnet_pos:
-            return None
+            return []
 
-        results = []  # tuple of lemma and average similarity score
-        lemma_count = 0
+        senses = []
         for synset in wn.synsets(lemma, pos=wordnet_pos[pos]):
-            if lemma.lower() not in [l.name().lower() for l in synset.lemmas()]:
-                continue
-
-            extended_gloss = {synset.definition(): 1}  # gloss and weightage map
-            for s in synset.hypernyms():
-                extended_gloss[s.definition()] = _compute_weightage(synset, s)
-                for e in s.examples():
-                    extended_gloss[e] = extended_gloss[s.definition()] * self.discount_factor
-
-            for s in synset.hyponyms():
-                extended_gloss[s.definition()] = _compute_weightage(synset, s)
-                for e in s.examples():
-                    extended_gloss[e] = extended_gloss[s.definition()] * self.discount_factor
-
-            for s in synset.verb_groups():
-                extended_gloss[s.definition()] = _compute_weightage(synset, s)
-                for e in s.examples():
-                    extended_gloss[e] = extended_gloss[s.definition()] * self.discount_factor
-
-            for s in synset.similar_tos():
-                extended_gloss[s.definition()] = _compute_weightage(synset, s)
-                for e in s.examples():
-                    extended_gloss[e] = extended_gloss[s.definition()] * self.discount_factor
-
             for lemma_ in synset.lemmas():
                 if lemma_.name().lower() == lemma.lower():
-                    for s in [l.synset() for l in lemma_.derivationally_related_forms()]:
-                        extended_gloss[s.definition()] = _compute_weightage(synset, s)
+                    extended_gloss = None if self.sense_index is None else self.sense_index.get_extended_gloss(lemma_)
+                    if extended_gloss is None:
+                        extended_gloss = get_extended_gloss(lemma_)
+                    extended_gloss = {gloss: weightage * self.discount_factor if discounted else weightage
+                                      for gloss, weightage, discounted in extended_gloss}
+                    senses.append(Sense(lemma_.key(), lemma_.count(), synset.lemma_names(), extended_gloss))
                     break
 
-            for e in synset.examples():
-                extended_gloss[e] = 1
+        return senses
 
-            sentences = [sentence] + list(extended_gloss.keys())
-            embeddings = self.encoder.get_vectors(sentences)
-            similarity_matrix = np.inner(embeddings, embeddings)
+    def _get_embeddings(self, texts, known=None):
+        """
+        :param known: dictionary of the embeddings of texts that were already embedded
+        """
+        known = dict() if known is None else known
+        texts_in_store = set() if self.gloss_store is None else {text for text in texts if text in self.gloss_store}
+        stored = [i for i, text in enumerate(texts) if text not in known and text in texts_in_store]
+        encoded = [i for i, text in enumerate(texts) if text not in known and text not in texts_in_store]
 
-            score = 0
-            weightage = list(extended_gloss.values())
-            for i in range(1, len(similarity_matrix)):
-                score += similarity_matrix[0][i] * weightage[i - 1]
+        embeddings = np.empty((len(texts), self.encoder.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            if text in known:
+                embeddings[i] = known[text]
+        if stored:
+            embeddings[stored] = self.gloss_store.get_vectors([texts[i] for i in stored])
+        for i in range(0, len(encoded), _ENCODER_BATCH_SIZE):
+            rows = encoded[i:i + _ENCODER_BATCH_SIZE]
+            embeddings[rows] = self.encoder.get_vectors([texts[j] for j in rows])
 
-            for lemma_ in synset.lemmas():
-                if lemma_.name().lower() == lemma.lower():
-                    lemma_count += lemma_.count()
-                    results.append((lemma_, score))
-                    break
+        return embeddings
 
-        if not results:
-            return None
+    def _score_senses(self, requests, known=None):
+        """ Computes the wsd score of every candidate sense of a batch of words.
 
-        sense_count = len(results)
-        results = [(l.key(), s * ((l.count() + 1) / (lemma_count + sense_count))) for l, s in results]
+        The sentences and glosses of the whole batch are embedded together in a few large encoder calls (or read from
+        the gloss store), and their similarities are computed with a single matrix product.
 
-        return sorted(results, key=lambda r: r[1], reverse=True)[0][0]
+        :param requests: list of (sentence, senses) tuples, where `senses` is returned by `_get_senses`
+        :param known: dictionary of the embeddings of sentences that were already embedded
+        :return: list of the scores of each sense, for each request
+        """
+        texts = dict()  # text -> row in the embedding matrix
+        for sentence, senses in requests:
+            if senses:  # words without candidate senses need no embedding
+                texts.setdefault(sentence, len(texts))
+            for sense in senses:
+                for gloss in sense.extended_gloss:
+                    texts.setdefault(gloss, len(texts))
+        if not texts:
+            return [[] for _ in requests]
 
-    def _get_synonyms(self, spacy_doc, word):
-        sentence = spacy_doc.text
-        if not sentence or not word or word.lower() in stopwords.words('english') or len(word.split()) > 1:
-            return []
+        texts = list(texts)
+        embeddings = self._get_embeddings(texts, known)
+        rows = {text: i for i, text in enumerate(texts)}
+        sentence_rows = list(dict.fromkeys(rows[sentence] for sentence, senses in requests if senses))
+        similarity_matrix = np.inner(embeddings[sentence_rows], embeddings)
+        sentence_rows = {row: i for i, row in enumerate(sentence_rows)}
+
+        # weighted similarities of all glosses of all senses, accumulated per sense in gloss order
+        pair_sentences, pair_glosses, pair_weightages, pair_senses = [], [], [], []
+        num_senses = 0
+        for sentence, senses in requests:
+            for sense in senses:
+                for gloss, weightage in sense.extended_gloss.items():
+                    pair_sentences.append(sentence_rows[rows[sentence]])
+                    pair_glosses.append(rows[gloss])
+                    pair_weightages.append(weightage)
+                    pair_senses.append(num_senses)
+                num_senses += 1
+        similarities = similarity_matrix[pair_sentences, pair_glosses].astype(np.float64)
+        scores = np.bincount(pair_senses, weights=similarities * pair_weightages, minlength=num_senses).tolist()
+
+        results = []
+        offset = 0
+        for _, senses in requests:
+            results.append(scores[offset:offset + len(senses)])
+            offset += len(senses)
+
+        return results
+
+    @staticmethod
+    def _choose_sense(senses, scores):
+        lemma_count = sum(sense.count for sense in senses)
+        sense_count = len(senses)
+        results = [(sense, s * ((sense.count + 1) / (lemma_count + sense_count))) for sense, s in zip(senses, scores)]
+
+        return sorted(results, key=lambda r: r[1], reverse=True)[0]
+
+    def _select_senses(self, requests):
+        """
+        :param requests: list of (sentence, lemma, pos, senses) tuples, where `senses` is returned by `_get_senses`
+        :return: best `Sense` (or None) and its score of each request
+        """
+        best_senses = [(None, None)] * len(requests)
+        pending = [i for i, (_, _, _, senses) in enumerate(requests) if senses]
+        known = None
+        if self.decision_cache is not None and pending:
+            # sentences are embedded first, to look up the decisions made for the same words in similar sentences
+            sentences = list(dict.fromkeys(requests[i][0] for i in pending))
+            known = dict(zip(sentences, self._get_embeddings(sentences)))
+            signatures = dict(zip(sentences, self.decision_cache.get_signatures([known[s] for s in sentences])))
+            keys = {i: self.decision_cache.get_key(requests[i][1], requests[i][2], signatures[requests[i][0]])
+                    for i in pending}
+            decisions = self.decision_cache.get_many(keys.values())
 
-        # ignore `word` that is a part of noun_chunk
+            misses = []
+            for i in pending:
+                if keys[i] in decisions:
+                    key, score = decisions[keys[i]]
+                    sense = next((sense for sense in requests[i][3] if sense.key == key), None)
+                    if sense is not None:
+                        best_senses[i] = (sense, score)
+                        continue
+                misses.append(i)
+            pending = misses
+
+        scores_list = self._score_senses([(requests[i][0], requests[i][3]) for i in pending], known)
+        for i, scores in zip(pending, scores_list):
+            best_senses[i] = self._choose_sense(requests[i][3], scores)
+        if self.decision_cache is not None and pending:
+            self.decision_cache.put_many((keys[i], (best_senses[i][0].key, best_senses[i][1])) for i in pending)
+
+        return best_senses
+
+    def _get_best_sense_keys(self, requests):
+        """
+        :param requests: list of (sentence, lemma, pos) tuples
+        :return: key of the best WordNet lemma (or None) of each request
+        """
+        best_senses = self._select_senses([(sentence, lemma, pos, self._get_senses(lemma, pos))
+                                           for sentence, lemma, pos in requests])
+
+        return [None if sense is None else sense.key for sense, _ in best_senses]
+
+    def _get_best_sense_key(self, sentence, lemma, pos):
+        return self._get_best_sense_keys([(sentence, lemma, pos)])[0]
+
+    @staticmethod
+    def _get_candidate_tokens(spacy_doc):
+        """ Returns a dictionary mapping each word of `spacy_doc` that can be substituted by its synonyms to its
+        (first) token
+        """
+        if not spacy_doc.text:
+            return dict()
+
+        stop_words = _get_stopwords()
+        # ignore words that are a part of noun_chunk
+        chunk_words = set()
         for noun_chunk in spacy_doc.noun_chunks:
             tokens = [t.strip(string.punctuation) for t in noun_chunk.text.split()
-                      if t.strip(string.punctuation).lower() not in stopwords.words('english')]
-            if len(tokens) > 1 and word in tokens:
-                return []
+                      if t.strip(string.punctuation).lower() not in stop_words]
+            if len(tokens) > 1:
+                chunk_words.update(tokens)
 
+        candidates = dict()
         for token in spacy_doc:
-            if token.text == word:
-                key = self._get_best_sense_key(sentence, token.lemma_, token.pos_)
-                if key is None:
-                    return []
-                else:
-                    return [w.replace("_", " ") for w in wn.lemma_from_key(key).synset().lemma_names()
-                            if w.lower() != word.lower()]
+            word = token.text
+            if (word and word not in candidates and word.lower() not in stop_words and len(word.split()) <= 1 and
+                    word not in chunk_words):
+                candidates[word] = token
+
+        return candidates
+
+    @staticmethod
+    def _get_synonyms_of_sense(sense, word):
+        if sense is None:
+            return []
+        else:
+            return [w.replace("_", " ") for w in sense.lemma_names if w.lower() != word.lower()]
+
+    def _get_synonyms(self, spacy_doc, word):
+        token = self._get_candidate_tokens(spacy_doc).get(word)
+        if token is None:
+            return []
+
+        sense, _ = self._select_senses([(spacy_doc.text, token.lemma_, token.pos_,
+                                         self._get_senses(token.lemma_, token.pos_))])[0]
+        return self._get_synonyms_of_sense(sense, word)
+
+    def _extract(self, spacy_doc):
+        """ Returns the tokens of `spacy_doc` and the (word, token position, lemma, POS, candidate senses) of each token
+        that may be substituted, i.e. all the CPU-side work that does not need the encoder
+        """
+        counts = Counter(token.text for token in spacy_doc)
+        candidates = [(word, token.i, token.lemma_, token.pos_, self._get_senses(token.lemma_, token.pos_))
+                      for word, token in self._get_candidate_tokens(spacy_doc).items() if counts[word] == 1]
+
+        return [token.text for token in spacy_doc], candidates
+
+    def _extract_batch(self, sentences):
+        return [(doc.text, *self._extract(doc)) for doc in get_spacy_model().pipe(sentences, disable=['ner'])]
+
+    def _generate_batch(self, extractions):
+        """ Yields the generated questions (and their replaced words) of a batch of questions extracted by
+        `_extract_batch`
+        """
+        # senses of the candidate tokens of all questions in the batch are disambiguated together
+        requests = [(sentence, lemma, pos, senses)
+                    for sentence, _, candidates in extractions for _, _, lemma, pos, senses in candidates]
+        best_senses = iter(self._select_senses(requests))
+
+        for sentence, tokens, candidates in extractions:
+            substitutions = []
+            for word, position, _, _, _ in candidates:
+                sense, score = next(best_senses)
+                syms = self._get_synonyms_of_sense(sense, word)
+                if syms:
+                    substitutions.append((position, [word] + syms, score))
+
+            yield sentence, list(islice(self._substitute(sentence, tokens, substitutions), self.max_outputs))
+
+    def _iter_combinations(self, sentence, substitutions):
+        """ Yields the combinations of synonyms to substitute according to the sampling policy, as tuples holding the
+        index of the synonym chosen for each substitutable word (0 keeps the original word)
+        """
+        sizes = [len(synonyms) for _, synonyms, _ in substitutions]
+        if self.sampling == 'all':
+            combinations = product(*[range(size) for size in sizes])
+            next(combinations)  # skip the first combination as it contains all original tokens
+            yield from combinations
+        elif self.sampling == 'uniform':
+            total = reduce(operator.mul, sizes, 1)
+            # seeded by the sentence, so that the samples do not depend on the order of the inputs
+            rng = random.Random(f"{self.seed}:{sentence}")
+            if total - 1 <= 2 * self.max_outputs:
+                # few enough combinations to shuffle them all
+                for index in rng.sample(range(1, total), total - 1):
+                    combination = []
+                    for size in reversed(sizes):
+                        index, choice = divmod(index, size)
+                        combination.append(choice)
+                    yield tuple(reversed(combination))
+            else:
+                # draw each combination lazily, rejecting the original tokens and the combinations already drawn. Far
+                # more combinations exist than are drawn, so rejections are rare.
+                seen = set()
+                while len(seen) < total - 1:
+                    combination = tuple(rng.randrange(size) for size in sizes)
+                    if any(combination) and combination not in seen:
+                        seen.add(combination)
+                        yield combination
+        elif self.sampling == 'top-k':
+            for subset in _iter_subsets_by_rank([score for _, _, score in substitutions]):
+                for choices in product(*[range(1, sizes[i]) for i in subset]):
+                    combination = [0] * len(sizes)
+                    for i, choice in zip(subset, choices):
+                        combination[i] = choice
+                    yield tuple(combination)
+        elif self.sampling == 'single':
+            for i, size in enumerate(sizes):
+                for choice in range(1, size):
+                    combination = [0] * len(sizes)
+                    combination[i] = choice
+                    yield tuple(combination)
+
+    def _substitute(self, sentence, tokens, substitutions):
+        """ Yields the questions generated by substituting synonyms into the `tokens` of `sentence`, along with a
+        dictionary mapping each replaced word to its synonym
+
+        :param substitutions: list of (token position, [word] + synonyms, sense score) tuples
+        """
+        for combination in self._iter_combinations(sentence, substitutions):
+            temp = tokens.copy()
+            replacements = dict()
+            for (position, synonyms, _), choice in zip(substitutions, combination):
+                temp[position] = synonyms[choice]
+                if choice != 0:
+                    replacements[synonyms[0]] = synonyms[choice]
+
+            sent = ' '.join(temp).strip('?').strip() + "?"
+            if sent != sentence:
+                yield sent, replacements
 
     def generate(self, sentence):
-        return list(self.batch_generate([sentence], use_tqdm=False).values())[0]
+        return next(self.iter_generate([sentence]))[1]
 
-    def batch_generate(self, sentences, use_tqdm=True):
-        results = dict()
-        nlp = get_spacy_model()
-        with nlp.disable_pipes('ner'):
-            docs = nlp.pipe(sentences)
-            for doc in (tqdm(docs, total=len(sentences)) if use_tqdm else docs):
-                sentence = doc.text
-                tokens = [token.text for token in doc]
-                tokens_for_sub = [token for token in tokens if tokens.count(token) == 1]
-                token2synonyms = dict()
-                for token in tokens_for_sub:
-                    syms = self._get_synonyms(doc, token)
-                    if syms:
-                        token2synonyms[token] = [token] + syms
-
-                result = []
-                keys = list(token2synonyms.keys())
-                combinations = product(*token2synonyms.values())
-                next(combinations)  # skip the first combination as it contains all original tokens
-                for combination in combinations:
-                    temp = tokens.copy()
-                    for i, sub_token in enumerate(combination):
-                        key = keys[i]
-                        temp[temp.index(key)] = sub_token
-
-                    sent = ' '.join(temp).strip('?').strip() + "?"
-                    if sent != sentence:
-                        result.append(sent)
-
-                results[sentence] = result
+    def iter_generate(self, sentences):
+        for sentence, substitutions in self.iter_substitutions(sentences):
+            yield sentence, [generated for generated, _ in substitutions]
 
-        return results
+    def iter_substitutions(self, sentences):
+        """ Same as `iter_generate`, except that each generated question comes with a dictionary mapping each replaced
+        word of the source question to its synonym
+        """
+        sentences = iter(sentences)
+        while True:
+            # only a few batches per worker are read ahead, so memory stays bounded on arbitrarily long streams
+            batches = []
+            for _ in range(max(1, self.workers) * _BATCHES_PER_WORKER):
+                batch = list(islice(sentences, _BATCH_SIZE))
+                if not batch:
+                    break
+                batches.append(batch)
+            if not batches:
+                return
+
+            # parsing and WordNet lookups run in the worker processes while the encoder scores the previous batches
+            if self.workers > 1:
+                extractions = _coalesce_ready(self._get_pool().imap(_extract_in_worker, batches))
+            else:
+                extractions = map(self._extract_batch, batches)
+
+            for batch_extractions in extractions:
+                yield from self._generate_batch(batch_extractions)
+
+    def batch_generate(self, sentences, use_tqdm=True):
+        generated = self.iter_generate(sentences)
+        return dict(tqdm(generated, total=len(sentences)) if use_tqdm else generated)
@@ -1,8 +1,12 @@
 import importlib
+import itertools
 import sys
 
 from .base import BaseGenerator
 
+# Number of questions reformulated at a time
+_BATCH_SIZE = 64
+
 
 class ZeroShotGenerator(BaseGenerator):
     """ Generate questions using zero-shot neural machine translation model
@@ -32,18 +36,20 @@ class ZeroShotGenerator(BaseGenerator):
         return reformulator_instance
 
     def generate(self, sentence):
-        return list(self.batch_generate([sentence]).values())[0]
+        return next(self.iter_generate([sentence]))[1]
 
-    def batch_generate(self, sentences):
+    def iter_generate(self, sentences):
         reformulator_pb2 = importlib.import_module('px.proto.reformulator_pb2')
-        responses = self.reformulator.reformulate(questions=sentences,
-                                                  inference_mode=reformulator_pb2.ReformulatorRequest.BEAM_SEARCH)
-
-        results = dict()
-        for i, response in enumerate(responses):
-            temp = []
-            for j, rewrite in enumerate(response):
-                temp.append(rewrite.reformulation)
-            results[sentences[i]] = temp
-
-        return results
+        sentences = iter(sentences)
+        while True:
+            batch = list(itertools.islice(sentences, _BATCH_SIZE))
+            if not batch:
+                return
+
+            responses = self.reformulator.reformulate(questions=batch,
+                                                      inference_mode=reformulator_pb2.ReformulatorRequest.BEAM_SEARCH)
+            for i, response in enumerate(responses):
+                temp = []
+                for j, rewrite in enumerate(response):
+                    temp.append(rewrite.reformulation)
+                yield batch[i], temp
@@ -0,0 +1,258 @@
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """ Least recently used cache bounded by its number of entries and by the total size of its values. """
+
+    def __init__(self, max_size=None, max_bytes=None, sizeof=sys.getsizeof):
+        """
+        :param max_size: maximum number of entries, unbounded if None
+        :param max_bytes: maximum total size of the values in bytes, unbounded if None
+        :param sizeof: function that returns the (estimated) size of a value in bytes
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        return self._entries[key][0]
+
+    def put(self, key, value):
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1]
+
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # would evict everything else and still not fit
+
+        self._entries[key] = (value, size)
+        self.bytes += size
+        self._evict()
+
+    def resize(self, max_size=None, max_bytes=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0
+        }
+
+    def _evict(self):
+        while self._entries and ((self.max_size is not None and len(self._entries) > self.max_size) or
+                                 (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+
+class SqliteStore:
+    """ Persistent key-value store backed by a table of a sqlite database, with pickled values.
+
+    The connection is opened on first use and re-opened in every process the store is sent to, so that a store can be
+    shared with worker processes.
+    """
+
+    def __init__(self, path, table='cache', readonly=False):
+        """
+        :param path: path to the sqlite database, created if it does not exist (unless `readonly`)
+        :param table: name of the table holding the key-value pairs
+        :param readonly: whether to open the database in read-only mode
+        """
+        self.path = path
+        self.table = table
+        self.readonly = readonly
+
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return self.path, self.table, self.readonly
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __contains__(self, key):
+        return len(self._fetch(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,))) != 0
+
+    def __len__(self):
+        return self._fetch(f"SELECT COUNT(*) FROM {self.table}")[0][0]
+
+    def _get_connection(self):
+        if self._connection is None or self._pid != os.getpid():
+            if self.readonly:
+                connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                connection = sqlite3.connect(self.path, check_same_thread=False)
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key PRIMARY KEY, value BLOB)")
+                connection.commit()
+            self._connection = connection
+            self._pid = os.getpid()
+
+        return self._connection
+
+    def _fetch(self, sql, parameters=()):
+        with self._lock:
+            return self._get_connection().execute(sql, parameters).fetchall()
+
+    def get(self, key, default=None):
+        rows = self._fetch(f"SELECT value FROM {self.table} WHERE key = ?", (key,))
+        if not rows:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+
+        return pickle.loads(rows[0][0])
+
+    def get_many(self, keys):
+        """ Returns a dictionary of the values of `keys` found in the store.
+        """
+        keys = list(dict.fromkeys(keys))
+        values = dict()
+        # bounded by the maximum number of host parameters of sqlite
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = self._fetch(f"SELECT key, value FROM {self.table} WHERE key IN ({', '.join('?' * len(batch))})",
+                               batch)
+            values.update((key, pickle.loads(value)) for key, value in rows)
+        self.hits += len(values)
+        self.misses += len(keys) - len(values)
+
+        return values
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        with self._lock:
+            connection = self._get_connection()
+            connection.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)",
+                                   ((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in items))
+            connection.commit()
+
+    def clear(self):
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute(f"DELETE FROM {self.table}")
+            connection.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0
+        }
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class TieredCache:
+    """ `LRUCache` in front of an optional persistent `SqliteStore`.
+
+    Lookups that miss in memory fall back to the store (and are promoted to memory), and new values are written to
+    both tiers, so that they survive across runs.
+    """
+
+    def __init__(self, memory, store=None):
+        self.memory = memory
+        self.store = store
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        """ Returns a dictionary of the values of `keys` found in either tier.
+        """
+        keys = list(dict.fromkeys(keys))
+        values = dict()
+        for key in keys:
+            value = self.memory.get(key, _MISSING)
+            if value is not _MISSING:
+                values[key] = value
+        if self.store is not None and len(values) < len(keys):
+            stored = self.store.get_many(key for key in keys if key not in values)
+            for key, value in stored.items():
+                self.memory.put(key, value)
+            values.update(stored)
+        self.hits += len(values)
+        self.misses += len(keys) - len(values)
+
+        return values
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        items = list(items)
+        for key, value in items:
+            self.memory.put(key, value)
+        if self.store is not None:
+            self.store.put_many(items)
+
+    def clear(self):
+        self.memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0,
+            'memory': self.memory.stats(),
+            'store': None if self.store is None else self.store.stats()
+        }
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+from .file import ResultsWriter
+
+
+def _hash_questions(questions):
+    return hashlib.sha1("\n".join(questions).encode('utf-8')).hexdigest()
+
+
+def parse_question(line):
+    """ Return the question held by a `line` of the input file (in bytes), or None if the line is empty.
+    """
+    question = line.decode('utf-8').strip()
+
+    return question if len(question) != 0 else None
+
+
+def _read_questions(f, start, end):
+    f.seek(start)
+    questions = [parse_question(line) for line in f.read(end - start).split(b'\n')]
+
+    return [question for question in questions if question is not None]
+
+
+class Checkpoint:
+    """ Manifest of the batches of a generation run whose results are already persisted.
+
+    Results are appended batch by batch to a JSON lines file. After each batch, the manifest records the byte offsets
+    of the batch in the input file, a hash of its questions and the size of the results file, so that an interrupted
+    run can verify what was done, drop any partially written batch and resume right after the last completed one.
+    """
+
+    def __init__(self, method, input_path, output_path):
+        self.method = method
+        self.input_path = input_path
+        self.output_path = output_path
+        self.manifest_path = f"{output_path}.manifest.json"
+        # results are only converted into a single JSON object once the run is complete. The JSON lines file is kept
+        # alongside, so that the run can still be resumed if more questions are appended to the input file later.
+        self.results_path = output_path if output_path.endswith('.jsonl') else f"{output_path}.checkpoint.jsonl"
+        self.batches = []
+
+    @property
+    def input_offset(self):
+        return self.batches[-1]['input_end'] if self.batches else 0
+
+    @property
+    def output_offset(self):
+        return self.batches[-1]['output_end'] if self.batches else 0
+
+    @property
+    def num_questions(self):
+        return sum(batch['num_questions'] for batch in self.batches)
+
+    @property
+    def num_generated(self):
+        return sum(batch['num_generated'] for batch in self.batches)
+
+    def reset(self):
+        self.batches = []
+        open(self.results_path, 'w').close()
+        self._save()
+
+    def restore(self):
+        """ Load the manifest of a previous run and keep the completed batches that still match the input file.
+        """
+        if not os.path.exists(self.manifest_path) or not os.path.exists(self.results_path):
+            print("No previous run to resume from. Starting from scratch...")
+            return self.reset()
+
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['method'] != self.method or manifest['input_path'] != os.path.abspath(self.input_path):
+            print(f"Previous run was generated by {manifest['method']} from {manifest['input_path']}. "
+                  f"Starting from scratch...")
+            return self.reset()
+
+        self.batches = []
+        with open(self.input_path, 'rb') as f:
+            for batch in manifest['batches']:
+                questions = _read_questions(f, batch['input_start'], batch['input_end'])
+                if _hash_questions(questions) != batch['hash']:
+                    print(f"Input file changed from batch #{len(self.batches)} onwards.")
+                    break
+                self.batches.append(batch)
+
+        # discard results of a batch that was interrupted before it was committed
+        with open(self.results_path, 'r+b') as f:
+            f.truncate(self.output_offset)
+        self._save()
+        print(f"Resuming after {len(self.batches)} completed batches ({self.num_questions} questions)...")
+
+    def commit(self, input_start, input_end, questions, output_end, num_generated):
+        """ Record a batch whose results are persisted up to byte `output_end` of the results file.
+        """
+        self.batches.append({
+            'input_start': input_start,
+            'input_end': input_end,
+            'hash': _hash_questions(questions),
+            'output_end': output_end,
+            'num_questions': len(questions),
+            'num_generated': num_generated
+        })
+        self._save()
+
+    def finalize(self):
+        """ Write the final output file once every batch is completed.
+        """
+        if self.results_path == self.output_path:
+            return
+
+        print(f"Saving result to {self.output_path}...")
+        with open(self.results_path, 'r', encoding='utf-8') as f, ResultsWriter(self.output_path) as writer:
+            for line in f:
+                result = json.loads(line)
+                writer.write(result['question'], result['generated'])
+
+    def _save(self):
+        manifest = {'method': self.method, 'input_path': os.path.abspath(self.input_path), 'batches': self.batches}
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)  # atomic, so the manifest is never left half-written
@@ -55,3 +55,46 @@ def split_file(input_path, output_path1, output_path2, split_ratio):
 def delete_file(*paths):
     for path in paths:
         os.remove(path)
+
+
+class ResultsWriter:
+    """ Stream (question, generated questions) pairs to a file without holding them in memory.
+
+    Pairs are written as JSON lines ({"question": ..., "generated": [...]}) if `path` ends with '.jsonl', otherwise as
+    a single JSON object mapping each question to its generated questions.
+    """
+
+    def __init__(self, path, mode='w'):
+        self.path = path
+        self.lines = path.endswith('.jsonl')
+        self.num_written = 0
+        self._file = open(path, mode, encoding='utf-8')
+        if not self.lines:
+            self._file.write("{")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, question, generated):
+        if self.lines:
+            self._file.write(json.dumps({"question": question, "generated": generated}) + "\n")
+        else:
+            self._file.write(f"{', ' if self.num_written else ''}{json.dumps(question)}: {json.dumps(generated)}")
+        self.num_written += 1
+
+    def flush(self):
+        """ Flush written pairs to disk and return the size of the file in bytes.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        return os.fstat(self._file.fileno()).st_size
+
+    def close(self):
+        if not self._file.closed:
+            if not self.lines:
+                self._file.write("}")
+            self._file.close()
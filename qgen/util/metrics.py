@@ -0,0 +1,79 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets in seconds, doubling from 10 us to about 84 s
+LATENCY_BUCKETS = [1e-5 * 2 ** i for i in range(24)]
+# Upper bounds of the size buckets, doubling from 1 to 65536
+SIZE_BUCKETS = [2 ** i for i in range(17)]
+
+
+class Histogram:
+    """ Histogram of values over sorted buckets, cheap enough to record every call. """
+
+    def __init__(self, buckets=SIZE_BUCKETS):
+        """
+        :param buckets: sorted upper bounds of the buckets. Values above the last bound are counted in an overflow
+                        bucket.
+        """
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """ Returns the upper bound of the bucket holding the `q`-th percentile (or the maximum value, if lower)
+        """
+        if self.count == 0:
+            return 0
+
+        rank = q / 100 * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+            'buckets': {bound: count for bound, count in zip(self.buckets + [float('inf')], self.counts) if count}
+        }
+
+
+class LatencyHistogram(Histogram):
+    """ Histogram of latencies in seconds over exponentially growing buckets. """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        super().__init__(buckets)
+
+    @contextmanager
+    def time(self):
+        """ Records the time spent in the body of a `with` statement
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
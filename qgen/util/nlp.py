@@ -3,9 +3,19 @@ import string
 import en_core_web_md
 import spacy
 
+from .cache import LRUCache
+
 _spacy_cache = None
 _coref_cache = None
 
+# Default bounds of the spaCy doc cache
+DOC_CACHE_SIZE = 10000
+DOC_CACHE_BYTES = 256 * 1024 ** 2
+# Rough memory footprint of a spaCy token (excluding its tensor)
+_TOKEN_BYTES = 256
+# Default bound of the coreference doc cache
+COREF_CACHE_SIZE = 1000
+
 FAST_TOKENIZER = spacy.load('en_core_web_sm', disable=['tagger', 'parser', 'ner', 'textcat'])
 
 # Linguistic Constants
@@ -92,6 +102,90 @@ def get_spacy_model():
     return _spacy_cache
 
 
+def _estimate_doc_bytes(doc):
+    return len(doc) * _TOKEN_BYTES + doc.tensor.nbytes + len(doc.text)
+
+
+_spacy_docs_cache = LRUCache(DOC_CACHE_SIZE, DOC_CACHE_BYTES, sizeof=_estimate_doc_bytes)
+_parse_stats = {'parses': 0, 'calls': 0}
+_coref_docs_cache = LRUCache(COREF_CACHE_SIZE)
+_coref_stats = {'parses': 0, 'calls': 0}
+
+
+def configure_doc_cache(max_size=DOC_CACHE_SIZE, max_bytes=DOC_CACHE_BYTES):
+    """ Set the bounds of the spaCy doc cache used by `get_spacy_doc` and `get_spacy_docs`. None means unbounded.
+    """
+    _spacy_docs_cache.resize(max_size, max_bytes)
+
+
+def clear_doc_cache():
+    _spacy_docs_cache.clear()
+
+
+def get_doc_cache_stats():
+    """ Return statistics of the spaCy doc cache, along with the number of parsed texts and spaCy calls.
+    """
+    return dict(_spacy_docs_cache.stats(), **_parse_stats)
+
+
+def _get_doc_key(sentence):
+    # trailing whitespace changes neither the tokens nor their character offsets, so such variants can share a doc
+    return sentence.rstrip()
+
+
+def get_spacy_doc(sentence):
+    """ Return cached spaCy doc (without named entities) of `sentence`.
+    """
+    return get_spacy_docs([sentence])[0]
+
+
+def _get_cached_docs(keys, cache, parse, stats):
+    docs = {key: cache.get(key) for key in keys}
+    missing = [key for key, doc in docs.items() if doc is None]
+    if missing:
+        for key, doc in zip(missing, parse(missing)):
+            docs[key] = doc
+            cache.put(key, doc)
+        stats['parses'] += len(missing)
+        stats['calls'] += 1
+
+    return [docs[key] for key in keys]
+
+
+def get_spacy_docs(sentences):
+    """ Return cached spaCy docs (without named entities) of `sentences`, parsing all cache misses in a single batch.
+    """
+    def parse(texts):
+        spacy_nlp = get_spacy_model()
+        with spacy_nlp.disable_pipes('ner'):
+            return list(spacy_nlp.pipe(texts))
+
+    return _get_cached_docs([_get_doc_key(s) for s in sentences], _spacy_docs_cache, parse, _parse_stats)
+
+
+def configure_coref_cache(max_size=COREF_CACHE_SIZE):
+    """ Set the bound of the coreference doc cache used by `get_coref_docs` and `resolve_coref`.
+    """
+    _coref_docs_cache.resize(max_size)
+
+
+def clear_coref_cache():
+    _coref_docs_cache.clear()
+
+
+def get_coref_cache_stats():
+    """ Return statistics of the coreference doc cache, along with the number of parsed texts and model calls.
+    """
+    return dict(_coref_docs_cache.stats(), **_coref_stats)
+
+
+def get_coref_docs(contexts):
+    """ Return cached NeuralCoref docs of `contexts`, running the coref model over all cache misses in a single batch.
+    """
+    return _get_cached_docs(contexts, _coref_docs_cache, lambda texts: list(_get_coref_model().pipe(texts)),
+                            _coref_stats)
+
+
 def _get_coref_model():
     global _coref_cache
 
@@ -133,11 +227,14 @@ def convert_contraction(sentence):
     return ' '.join(tokens)
 
 
-def resolve_coref(sentence, context):
+def resolve_coref(sentence, context, doc=None):
     """ Return a modified sentence with "mentions" replaced by the main entity
+
+    :param doc: NeuralCoref doc of `context`, if it was already computed
     """
-    coref_model = _get_coref_model()
-    doc = coref_model(context)
+    # the coref clusters of `context` are computed once and shared by every sentence resolved against it
+    if doc is None:
+        doc = get_coref_docs([context])[0]
     if not doc._.has_coref:
         return sentence
     else:
@@ -0,0 +1,393 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+from nltk.corpus import wordnet as wn
+from tqdm import tqdm
+
+from .cache import LRUCache, SqliteStore, TieredCache
+
+# Default number of extended glosses kept in memory by a `SenseIndex`
+SENSE_CACHE_SIZE = 10000
+# Default number of word sense decisions kept in memory by a `SenseCache`
+DECISION_CACHE_SIZE = 100000
+
+
+def get_glosses():
+    """ Returns the definitions and examples of every WordNet synset, without duplicates.
+    """
+    glosses = dict()
+    for synset in wn.all_synsets():
+        glosses[synset.definition()] = None
+        for example in synset.examples():
+            glosses[example] = None
+
+    return list(glosses)
+
+
+def _compute_weightage(main_synset, related_synset):
+    distance = main_synset.shortest_path_distance(related_synset)
+    if distance is None:
+        return 1
+    else:
+        return 1 / (1 + distance)
+
+
+def get_extended_gloss(lemma):
+    """ Returns the extended gloss of the sense of WordNet `lemma`, as a list of (gloss, weightage, discounted) tuples.
+
+    The extended gloss gathers the definitions and examples of the synset of `lemma` and of its related synsets, each
+    weighted by the path distance between the two synsets. The weightage of `discounted` glosses (the examples of
+    related synsets) is further multiplied by the discount factor of the word sense disambiguation.
+    """
+    synset = lemma.synset()
+    extended_gloss = {synset.definition(): (1, False)}  # gloss and (weightage, discounted) map
+    for s in synset.hypernyms() + synset.hyponyms() + synset.verb_groups() + synset.similar_tos():
+        weightage = _compute_weightage(synset, s)
+        extended_gloss[s.definition()] = (weightage, False)
+        for e in s.examples():
+            extended_gloss[e] = (weightage, True)
+
+    for s in [l.synset() for l in lemma.derivationally_related_forms()]:
+        extended_gloss[s.definition()] = (_compute_weightage(synset, s), False)
+
+    for e in synset.examples():
+        extended_gloss[e] = (1, False)
+
+    return [(gloss, weightage, discounted) for gloss, (weightage, discounted) in extended_gloss.items()]
+
+
+def get_synonyms(word):
+    """ Returns the sorted synonyms of `word` across all its synsets, in lower case and with characters other than
+    letters and spaces removed (as done by EDA).
+    """
+    synonyms = set()
+    for syn in wn.synsets(word):
+        for l in syn.lemmas():
+            synonym = l.name().replace("_", " ").replace("-", " ").lower()
+            synonym = "".join([char for char in synonym if char in ' qwertyuiopasdfghjklzxcvbnm'])
+            synonyms.add(synonym)
+    if word in synonyms:
+        synonyms.remove(word)
+
+    return sorted(synonyms)
+
+
+def get_synonym_table_path(cache_dir):
+    return os.path.join(cache_dir, 'synonyms')
+
+
+def load_synonym_table(cache_dir):
+    """ Returns the `SynonymTable` precomputed under `cache_dir`, or None if it has not been precomputed.
+    """
+    path = get_synonym_table_path(cache_dir)
+    if not os.path.exists(os.path.join(path, SynonymTable.INDEX_FILE)):
+        return None
+
+    return SynonymTable(path)
+
+
+def get_sense_index_path(cache_dir):
+    return os.path.join(cache_dir, 'senses.sqlite')
+
+
+def load_sense_index(cache_dir):
+    """ Returns the `SenseIndex` precomputed under `cache_dir`, or None if it has not been precomputed.
+    """
+    path = get_sense_index_path(cache_dir)
+    if not os.path.exists(path):
+        return None
+
+    return SenseIndex(path)
+
+
+def get_gloss_store_path(cache_dir, encoder_name):
+    """ Returns the directory of the gloss embeddings computed by the encoder named `encoder_name`.
+    """
+    return os.path.join(cache_dir, 'glosses', re.sub(r'[^a-z0-9]+', '-', encoder_name.lower()).strip('-'))
+
+
+def load_gloss_store(cache_dir, encoder_name):
+    """ Returns the `GlossStore` precomputed under `cache_dir` for the encoder named `encoder_name`, or None if it
+    has not been precomputed.
+    """
+    path = get_gloss_store_path(cache_dir, encoder_name)
+    if not os.path.exists(os.path.join(path, GlossStore.INDEX_FILE)):
+        return None
+
+    return GlossStore(path)
+
+
+class GlossStore:
+    """ Precomputed sentence embeddings of the WordNet glosses (definitions and examples).
+
+    The embeddings are stored as a float32 matrix in a .npy file that is memory-mapped read-only, so that the pages
+    are loaded lazily and shared by every process reading the same store. The index maps each gloss to its row.
+    """
+
+    EMBEDDINGS_FILE = 'embeddings.npy'
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, self.INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.encoder_name = index['encoder']
+        self.wordnet_version = index['wordnet']
+        self.rows = {gloss: i for i, gloss in enumerate(index['glosses'])}
+        self.embeddings = np.load(os.path.join(path, self.EMBEDDINGS_FILE), mmap_mode='r')
+
+    def __getstate__(self):
+        # worker processes re-open the memory-mapped file instead of receiving a copy of the embeddings
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def __contains__(self, gloss):
+        return gloss in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get_vectors(self, glosses):
+        return np.asarray(self.embeddings[[self.rows[gloss] for gloss in glosses]])
+
+    @classmethod
+    def build(cls, encoder, path, batch_size=512):
+        """ Embeds every WordNet gloss with `encoder` and saves the resulting store to `path`.
+        """
+        glosses = get_glosses()
+        os.makedirs(path, exist_ok=True)
+
+        # written to temporary files first, so that an interrupted build never leaves a partial store behind
+        embeddings_path = os.path.join(path, cls.EMBEDDINGS_FILE)
+        temp_path = f"{embeddings_path}.tmp"
+        embeddings = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float32,
+                                               shape=(len(glosses), encoder.dimension))
+        print(f"Embedding {len(glosses)} glosses with {encoder.name}...")
+        for i in tqdm(range(0, len(glosses), batch_size)):
+            embeddings[i:i + batch_size] = encoder.get_vectors(glosses[i:i + batch_size])
+        embeddings.flush()
+        del embeddings
+        os.replace(temp_path, embeddings_path)
+
+        index_path = os.path.join(path, cls.INDEX_FILE)
+        with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'encoder': encoder.name, 'wordnet': wn.get_version(), 'glosses': glosses}, f)
+        os.replace(f"{index_path}.tmp", index_path)
+
+        return cls(path)
+
+
+class SynonymTable:
+    """ Precomputed `get_synonyms` of every single word of the WordNet vocabulary.
+
+    Words and synonyms are stored as one UTF-8 blob with the offset of each string, and the synonyms of the i-th word
+    as a slice of an array of string ids. All arrays are memory-mapped read-only .npy files, so the table is shared by
+    every process reading it and loading it is instant. Words are sorted, so a lookup is a binary search.
+    """
+
+    INDEX_FILE = 'index.json'
+    ARRAYS = ['strings', 'string_offsets', 'synonym_ids', 'synonym_offsets']
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, self.INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.num_words = index['num_words']
+        self.wordnet_version = index['wordnet']
+        for name in self.ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def __len__(self):
+        return self.num_words
+
+    def _get_string(self, i):
+        return bytes(self.strings[self.string_offsets[i]:self.string_offsets[i + 1]]).decode('utf-8')
+
+    def _find(self, word):
+        # words are the first `num_words` strings, sorted by their UTF-8 encoding
+        key = word.encode('utf-8')
+        low, high = 0, self.num_words
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self.strings[self.string_offsets[middle]:self.string_offsets[middle + 1]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_words and self._get_string(low) == word:
+            return low
+
+        return None
+
+    def get(self, word, default=None):
+        """ Returns the synonyms of `word`, or `default` if `word` is not in the table.
+        """
+        i = self._find(word)
+        if i is None:
+            return default
+
+        return [self._get_string(j) for j in self.synonym_ids[self.synonym_offsets[i]:self.synonym_offsets[i + 1]]]
+
+    @classmethod
+    def build(cls, path):
+        """ Computes the synonyms of every single word of WordNet and saves the resulting table to `path`.
+        """
+        # only words made of letters can be looked up, since EDA strips everything else from the sentences
+        words = sorted({name.lower() for name in wn.all_lemma_names() if re.fullmatch('[a-z]+', name.lower())},
+                       key=lambda w: w.encode('utf-8'))
+        string_ids = {word: i for i, word in enumerate(words)}
+        synonym_ids, synonym_offsets = [], [0]
+        for word in tqdm(words):
+            synonym_ids.extend(string_ids.setdefault(synonym, len(string_ids)) for synonym in get_synonyms(word))
+            synonym_offsets.append(len(synonym_ids))
+
+        encoded = [string.encode('utf-8') for string in string_ids]
+        arrays = {
+            'strings': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            'string_offsets': np.cumsum([0] + [len(string) for string in encoded], dtype=np.int64),
+            'synonym_ids': np.array(synonym_ids, dtype=np.int32),
+            'synonym_offsets': np.array(synonym_offsets, dtype=np.int64)
+        }
+
+        # written to temporary files first, so that an interrupted build never leaves a partial table behind
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            with open(os.path.join(path, f"{name}.npy.tmp"), 'wb') as f:
+                np.save(f, array)
+            os.replace(os.path.join(path, f"{name}.npy.tmp"), os.path.join(path, f"{name}.npy"))
+        index_path = os.path.join(path, cls.INDEX_FILE)
+        with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'num_words': len(words), 'wordnet': wn.get_version()}, f)
+        os.replace(f"{index_path}.tmp", index_path)
+
+        return cls(path)
+
+
+class SenseIndex:
+    """ Precomputed extended glosses of every WordNet sense, so that word sense disambiguation does not traverse the
+    WordNet graph (nor compute path distances) at runtime.
+
+    Extended glosses are keyed by lemma key and refer to glosses by id, both stored in a sqlite database. They are
+    loaded lazily and the most recently used ones are kept in memory.
+    """
+
+    def __init__(self, path, cache_size=SENSE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._senses = SqliteStore(path, 'senses', readonly=True)
+        self._glosses = SqliteStore(path, 'glosses', readonly=True)
+        self._cache = LRUCache(cache_size)
+
+    def __getstate__(self):
+        return self.path, self.cache_size
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def get_extended_gloss(self, lemma):
+        """ Returns the extended gloss of WordNet `lemma` in the format of `get_extended_gloss`, or None if the sense
+        is not indexed.
+        """
+        key = lemma.key()
+        extended_gloss = self._cache.get(key)
+        if extended_gloss is None:
+            entries = self._senses.get(key)
+            if entries is None:
+                return None
+
+            glosses = self._glosses.get_many(gloss_id for gloss_id, _, _ in entries)
+            extended_gloss = [(glosses[gloss_id], weightage, discounted) for gloss_id, weightage, discounted in entries]
+            self._cache.put(key, extended_gloss)
+
+        return extended_gloss
+
+    def stats(self):
+        return self._cache.stats()
+
+    @classmethod
+    def build(cls, path, batch_size=10000):
+        """ Computes the extended gloss of every WordNet sense and saves the resulting index to `path`.
+        """
+        # written to a temporary file first, so that an interrupted build never leaves a partial index behind
+        temp_path = f"{path}.tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        senses = SqliteStore(temp_path, 'senses')
+        glosses = SqliteStore(temp_path, 'glosses')
+
+        gloss_ids = dict()
+        batch = []
+        for synset in tqdm(list(wn.all_synsets())):
+            for lemma in synset.lemmas():
+                entries = []
+                for gloss, weightage, discounted in get_extended_gloss(lemma):
+                    gloss_id = gloss_ids.setdefault(gloss, len(gloss_ids))
+                    entries.append((gloss_id, weightage, discounted))
+                batch.append((lemma.key(), entries))
+            if len(batch) >= batch_size:
+                senses.put_many(batch)
+                batch = []
+        senses.put_many(batch)
+        glosses.put_many((gloss_id, gloss) for gloss, gloss_id in gloss_ids.items())
+        meta = SqliteStore(temp_path, 'meta')
+        meta.put('wordnet', wn.get_version())
+        for store in [senses, glosses, meta]:
+            store.close()
+        os.replace(temp_path, path)
+
+        return cls(path)
+
+
+class SenseCache:
+    """ Cache of word sense disambiguation decisions, keyed by lemma, POS and a signature of the sentence embedding.
+
+    The signature of an embedding records on which side of `num_bits` random hyperplanes it lies (locality-sensitive
+    hashing), so near-duplicate sentences share a signature, and thus the decisions made for their words. Decisions are
+    kept in an LRU cache, optionally backed by a sqlite database that persists them across runs.
+    """
+
+    def __init__(self, dimension, namespace, num_bits=16, max_size=DECISION_CACHE_SIZE, path=None, seed=0):
+        """
+        :param dimension: dimension of the sentence embeddings
+        :param namespace: description of the settings the decisions depend on (e.g. encoder and discount factor),
+                          so that a persistent tier shared by different settings keeps their decisions apart
+        :param num_bits: number of bits of the signatures. The more bits, the closer sentences must be to share one.
+        :param max_size: maximum number of decisions kept in memory, unbounded if None
+        :param path: path to the sqlite database of the persistent tier, disabled if None
+        :param seed: random seed of the hyperplanes
+        """
+        self.num_bits = num_bits
+        self.hyperplanes = np.random.RandomState(seed).standard_normal((num_bits, dimension)).astype(np.float32)
+        namespace = f"{namespace}|{dimension}|{num_bits}|{seed}"
+        table = f"decisions_{hashlib.sha1(namespace.encode('utf-8')).hexdigest()[:16]}"
+        self.cache = TieredCache(LRUCache(max_size), None if path is None else SqliteStore(path, table))
+
+    def get_signatures(self, embeddings):
+        bits = np.inner(embeddings, self.hyperplanes) > 0
+        return [int(''.join('1' if bit else '0' for bit in row), 2) for row in bits]
+
+    @staticmethod
+    def get_key(lemma, pos, signature):
+        return f"{lemma.lower()}|{pos}|{signature}"
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def put_many(self, items):
+        self.cache.put_many(items)
+
+    def stats(self):
+        return self.cache.stats()
+
+    def close(self):
+        self.cache.close()
@@ -0,0 +1,151 @@
+import argparse
+import multiprocessing
+import re
+import time
+
+from qgen.generator import EDAGenerator
+from qgen.util.file import read_file
+from qgen.util.wordnet import load_synonym_table
+
+CACHE_PATH = "model/cache"
+
+SAMPLE_QUESTIONS = [
+    "Is it necessary for me to attend the lecture?",
+    "How much does the course cost?",
+    "Are there any scholarships for international students?",
+    "What is the deadline for application?",
+    "Can I apply for leave if I am sick?",
+    "When will the results be released?",
+    "Do I need to pay the fee?",
+    "What should I do if I lose my card?",
+    "Is it compulsory for students to attend lectures?",
+    "How do I apply?"
+]
+
+
+def benchmark_synonyms(questions, num_augs):
+    synonym_table = load_synonym_table(CACHE_PATH)
+    if synonym_table is None:
+        print(f"No synonym table found under {CACHE_PATH}, run `python script/precompute.py synonyms` first")
+        return
+
+    configs = [("Live WordNet", lambda n: EDAGenerator(num_aug=n, synonym_cache_size=0)),
+               ("Live WordNet + memo", lambda n: EDAGenerator(num_aug=n)),
+               ("Synonym table", lambda n: EDAGenerator(num_aug=n, synonym_table=synonym_table, synonym_cache_size=0))]
+    for num_aug in num_augs:
+        print(f"num_aug={num_aug}:")
+        baseline = None
+        for name, create_generator in configs:
+            generator = create_generator(num_aug)
+            start = time.perf_counter()
+            generated = [generator.generate(question) for question in questions]
+            elapsed = time.perf_counter() - start
+
+            if baseline is None:
+                baseline = elapsed, generated
+            assert generated == baseline[1], f"{name} generated different questions"
+            print(f"\t{name + ':':<21}{elapsed / len(questions) * 1000:.2f} ms/question, "
+                  f"speedup {baseline[0] / elapsed:.2f}x")
+
+
+def benchmark_workers(questions, max_workers, num_aug=9):
+    synonym_table = load_synonym_table(CACHE_PATH)
+    # enough questions for every worker to get several chunks
+    questions = questions * max(1, 10000 // len(questions))
+
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        generator = EDAGenerator(num_aug=num_aug, synonym_table=synonym_table, workers=workers)
+        start = time.perf_counter()
+        generated = list(generator.iter_generate(questions))
+        elapsed = time.perf_counter() - start
+        generator.close()
+
+        if baseline is None:
+            baseline = elapsed, generated
+        assert generated == baseline[1], f"{workers} workers generated different questions"
+        print(f"{workers} worker(s): {elapsed / len(questions) * 1000:.3f} ms/question, "
+              f"speedup {baseline[0] / elapsed:.2f}x")
+
+
+def _get_only_chars_legacy(line):
+    """ Character filtering as done before it was reduced to a regular expression
+    """
+    clean_line = ""
+
+    line = line.replace("’", "")
+    line = line.replace("'", "")
+    line = line.replace("-", " ")
+    line = line.replace("\t", " ")
+    line = line.replace("\n", " ")
+    line = line.lower()
+
+    for char in line:
+        if char in 'qwertyuiopasdfghjklzxcvbnm ':
+            clean_line += char
+        else:
+            clean_line += ' '
+
+    clean_line = re.sub(' +', ' ', clean_line)
+    if clean_line[0] == ' ':
+        clean_line = clean_line[1:]
+    return clean_line
+
+
+def benchmark_backends(questions, num_augs, repeat=100):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        legacy = [_get_only_chars_legacy(question) for question in questions]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        filtered = [EDAGenerator._get_only_chars(question) for question in questions]
+    filtered_time = time.perf_counter() - start
+
+    assert legacy == filtered, "Character filtering differs from the legacy implementation"
+    print(f"Character filtering: legacy {legacy_time / repeat / len(questions) * 1e6:.2f} us/question, "
+          f"regex {filtered_time / repeat / len(questions) * 1e6:.2f} us/question, "
+          f"speedup {legacy_time / filtered_time:.2f}x")
+
+    synonym_table = load_synonym_table(CACHE_PATH)
+    for num_aug in num_augs:
+        print(f"num_aug={num_aug}:")
+        baseline = None
+        for backend in ["python", "numpy"]:
+            generator = EDAGenerator(num_aug=num_aug, synonym_table=synonym_table, backend=backend)
+            generator.batch_generate(questions)  # warm up the synonym cache, so that only the operations are timed
+            start = time.perf_counter()
+            for _ in range(repeat // 10):
+                generated = list(generator.iter_generate(questions))
+            elapsed = time.perf_counter() - start
+
+            if baseline is None:
+                baseline = elapsed, generated
+            assert [len(g) for _, g in generated] == [len(g) for _, g in baseline[1]], \
+                f"{backend} backend generated a different number of questions"
+            print(f"\t{backend + ':':<8}{elapsed / (repeat // 10) / len(questions) * 1000:.3f} ms/question, "
+                  f"speedup {baseline[0] / elapsed:.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=["synonyms", "workers", "backends"], default="synonyms",
+                        help="Component to benchmark")
+    parser.add_argument("--input_path",
+                        help="Path to input file in plain text, each question is separated by newline. "
+                             "Use built-in sample questions if not specified")
+    parser.add_argument("--num_aug", type=int, nargs='+', default=[1, 4, 9, 16],
+                        help="Numbers of augmentations per question to benchmark (only used by synonyms and backends)")
+    parser.add_argument("--max_workers", type=int, default=multiprocessing.cpu_count(),
+                        help="Maximum number of worker processes to benchmark (only used by workers)")
+
+    args = parser.parse_args()
+
+    inputs = read_file(args.input_path) if args.input_path else SAMPLE_QUESTIONS
+    if args.target == "synonyms":
+        benchmark_synonyms(inputs, args.num_aug)
+    elif args.target == "workers":
+        benchmark_workers(inputs, args.max_workers)
+    elif args.target == "backends":
+        benchmark_backends(inputs, args.num_aug)
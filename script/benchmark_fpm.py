@@ -0,0 +1,164 @@
+import argparse
+import time
+
+import regex
+
+from qgen.generator import FPMGenerator
+from qgen.util import nlp
+from qgen.util.file import read_file
+
+SAMPLE_QUESTIONS = [
+    "Is it necessary for me to attend the lecture?",
+    "How much does the course cost?",
+    "Are there any scholarships for international students?",
+    "What is the deadline for application?",
+    "Can I apply for leave if I am sick?",
+    "When will the results be released?",
+    "Do I need to pay the fee?",
+    "What should I do if I lose my card?",
+    "Is it compulsry for studnts to atend lectures?",
+    "Hw do I apply?"
+]
+
+
+def _match_legacy(matcher, sentence):
+    """ Matching as done before the pattern index and the best-first search: every fuzzy regex is tried, then the
+    matches are sorted by fuzzy count and by effective length (ties go to the earlier pattern)
+    """
+    candidates = []
+    for i, (_, _, fuzzy_regex) in enumerate(matcher.entries):
+        match = regex.fullmatch(fuzzy_regex, sentence)
+        if match is not None:
+            candidates.append((sum(match.fuzzy_counts), -matcher.lengths[i], i, match))
+    candidates.sort(key=lambda x: x[:3])
+
+    return candidates
+
+
+def benchmark_matcher(questions):
+    matcher = FPMGenerator().matcher
+
+    full_scan_time = 0
+    indexed_time = 0
+    match_time = 0
+    num_candidates = 0
+    for question in questions:
+        sentence = question.strip("?")
+
+        start = time.perf_counter()
+        full_scan = _match_legacy(matcher, sentence)
+        full_scan_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        candidates = matcher.index.candidates(sentence)
+        indexed = [i for i in candidates if regex.fullmatch(matcher.entries[i][2], sentence)]
+        indexed_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = matcher.match(question)
+        match_time += time.perf_counter() - start
+
+        assert sorted(i for _, _, i, _ in full_scan) == indexed, \
+            f"Pattern index dropped a matching pattern for '{question}'"
+        if full_scan:
+            _, _, i, match = full_scan[0]
+            group_id, pattern, _ = matcher.entries[i]
+            assert result is not None and (result.group_id, result.pattern) == (group_id, pattern) and \
+                result.match.capturesdict() == match.capturesdict(), \
+                f"Best-first search and full scan disagree for '{question}'"
+        else:
+            assert result is None, f"Best-first search matched '{question}' but the full scan did not"
+        num_candidates += len(candidates)
+
+    print(f"Number of patterns: {len(matcher.entries)}")
+    print(f"Average number of candidates: {num_candidates / len(questions):.1f}")
+    print(f"Full scan:  {full_scan_time / len(questions) * 1000:.2f} ms/question")
+    print(f"Indexed:    {indexed_time / len(questions) * 1000:.2f} ms/question "
+          f"(speedup {full_scan_time / indexed_time:.2f}x)")
+    print(f"Best-first: {match_time / len(questions) * 1000:.2f} ms/question "
+          f"(speedup {full_scan_time / match_time:.2f}x)")
+
+
+def benchmark_parses(questions):
+    generator = FPMGenerator()
+
+    def count_parses(func):
+        nlp.clear_doc_cache()
+        nlp.clear_coref_cache()
+        before = nlp.get_doc_cache_stats(), nlp.get_coref_cache_stats()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        after = nlp.get_doc_cache_stats(), nlp.get_coref_cache_stats()
+
+        return [{k: a[k] - b[k] for k in ['parses', 'calls']} for a, b in zip(after, before)], elapsed
+
+    for name, func in [("Question by question", lambda: [generator.generate(q) for q in questions]),
+                       ("Batched", lambda: generator.batch_generate(questions))]:
+        (spacy_stats, coref_stats), elapsed = count_parses(func)
+        print(f"{name}: {elapsed / len(questions) * 1000:.2f} ms/question")
+        print(f"\tspaCy:       {spacy_stats['parses'] / len(questions):.2f} parses/question, "
+              f"{spacy_stats['calls'] / len(questions):.2f} calls/question")
+        print(f"\tNeuralCoref: {coref_stats['parses'] / len(questions):.2f} parses/question, "
+              f"{coref_stats['calls'] / len(questions):.2f} calls/question")
+
+
+def _substitute_legacy(pattern, tokens):
+    """ Slot filling as done before patterns were pre-tokenized into templates
+    """
+    pattern_tokens = pattern.split()
+    if (len(tokens['<sbj>']) == pattern_tokens.count('<sbj>') and
+            len(tokens['<obj>']) >= pattern_tokens.count('<obj>') and
+            len(tokens['<act>']) == pattern_tokens.count('<act>') and
+            len(tokens['<st>']) >= pattern_tokens.count('<st>')):
+        for token in ['<obj>', '<sbj>', '<act>', '<st>']:
+            for i in range(pattern_tokens.count(token)):
+                pattern_tokens[pattern_tokens.index(token)] = tokens[token][i].strip('?')
+
+        return ' '.join(pattern_tokens)
+
+
+def benchmark_templates(num_groups=5, repeat=100):
+    generator = FPMGenerator()
+    groups = sorted(range(len(generator.patterns)), key=lambda g: len(generator.patterns[g]), reverse=True)
+    fillers = {'<sbj>': "the students", '<obj>': "the course fee", '<act>': "pay the fee", '<st>': "I am sick"}
+
+    for group_id in groups[:num_groups]:
+        patterns = generator.patterns[group_id]
+        templates = generator.templates[group_id]
+        # extracted tokens of every distinct arity in the group
+        arities = {tuple(sorted(t.counts.items())) for t in templates}
+        tokens_list = [{token: [fillers[token]] * count for token, count in arity} for arity in arities]
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            legacy = [_substitute_legacy(p, tokens) for tokens in tokens_list for p in patterns]
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            filled = [t.fill(tokens) if t.accepts(tokens) else None for tokens in tokens_list for t in templates]
+        template_time = time.perf_counter() - start
+
+        assert legacy == filled, f"Templates and legacy substitution disagree in group #{group_id}"
+        print(f"Group #{group_id} ({len(patterns)} patterns): legacy {legacy_time / repeat * 1000:.3f} ms, "
+              f"templates {template_time / repeat * 1000:.3f} ms, speedup {legacy_time / template_time:.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=["matcher", "parses", "templates"], default="matcher",
+                        help="Component to benchmark")
+    parser.add_argument("--input_path",
+                        help="Path to input file in plain text, each question is separated by newline. "
+                             "Use built-in sample questions if not specified")
+
+    args = parser.parse_args()
+
+    inputs = read_file(args.input_path) if args.input_path else SAMPLE_QUESTIONS
+    if args.target == "matcher":
+        benchmark_matcher(inputs)
+    elif args.target == "parses":
+        benchmark_parses(inputs)
+    elif args.target == "templates":
+        benchmark_templates()
@@ -0,0 +1,171 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from qgen.generator import SymSubGenerator
+from qgen.util.file import read_file
+from qgen.util.nlp import get_spacy_model
+from qgen.util.wordnet import load_gloss_store, load_sense_index
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+USE_PATH = os.path.join(ROOT_PATH, 'model/pretrained/universal_sentence_encoder')
+CACHE_PATH = os.path.join(ROOT_PATH, 'model/cache')
+
+SAMPLE_QUESTIONS = [
+    "Is it necessary for me to attend the lecture?",
+    "How much does the course cost?",
+    "Are there any scholarships for international students?",
+    "What is the deadline for application?",
+    "Can I apply for leave if I am sick?",
+    "When will the results be released?",
+    "Do I need to pay the fee?",
+    "What should I do if I lose my card?",
+    "Where can I find the timetable of the examination?",
+    "How do I change my registered address?"
+]
+
+
+def get_requests(generator, questions):
+    """ Returns the (sentence, lemma, pos) of every token of `questions` whose sense is disambiguated by symsub
+    """
+    requests = []
+    for doc in get_spacy_model().pipe(questions, disable=['ner']):
+        words = [token.text for token in doc]
+        for word, token in generator._get_candidate_tokens(doc).items():
+            if words.count(word) == 1:
+                requests.append((doc.text, token.lemma_, token.pos_))
+
+    return requests
+
+
+def benchmark_senses(questions):
+    sense_index = load_sense_index(CACHE_PATH)
+    assert sense_index is not None, "Sense index not found, run `python script/precompute.py senses` first"
+    traversal = SymSubGenerator(None)
+    indexed = SymSubGenerator(None, sense_index=sense_index)
+    requests = get_requests(traversal, questions)
+
+    start = time.perf_counter()
+    expected = [traversal._get_senses(lemma, pos) for _, lemma, pos in requests]
+    traversal_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    senses = [indexed._get_senses(lemma, pos) for _, lemma, pos in requests]
+    indexed_time = time.perf_counter() - start
+
+    assert senses == expected, "Sense index and WordNet traversal disagree"
+    print(f"Number of disambiguated words: {len(requests)}")
+    print(f"WordNet traversal: {traversal_time / len(requests) * 1000:.2f} ms/word")
+    print(f"Sense index:       {indexed_time / len(requests) * 1000:.2f} ms/word")
+    print(f"Speedup:           {traversal_time / indexed_time:.2f}x")
+
+
+def benchmark_selection(questions):
+    from qgen.encoder.universal_sentence_encoder import USEEncoder
+
+    encoder = USEEncoder(USE_PATH)
+    baseline = SymSubGenerator(encoder)
+    precomputed = SymSubGenerator(encoder, gloss_store=load_gloss_store(CACHE_PATH, encoder.name),
+                                  sense_index=load_sense_index(CACHE_PATH))
+    requests = get_requests(baseline, questions)
+
+    start = time.perf_counter()
+    expected = baseline._get_best_sense_keys(requests)
+    baseline_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    keys = precomputed._get_best_sense_keys(requests)
+    precomputed_time = time.perf_counter() - start
+
+    print(f"Number of disambiguated words: {len(requests)}")
+    print(f"Agreement: {sum(k1 == k2 for k1, k2 in zip(keys, expected)) / len(requests) * 100:.1f}%")
+    print(f"Baseline:    {baseline_time / len(requests) * 1000:.2f} ms/word")
+    print(f"Precomputed: {precomputed_time / len(requests) * 1000:.2f} ms/word "
+          f"(gloss store: {precomputed.gloss_store is not None}, sense index: {precomputed.sense_index is not None})")
+    print(f"Speedup:     {baseline_time / precomputed_time:.2f}x")
+
+
+def benchmark_embeddings(questions):
+    from qgen.encoder.cache import CachedEncoder
+    from qgen.encoder.universal_sentence_encoder import USEEncoder
+
+    encoder = USEEncoder(USE_PATH)
+    cached_encoder = CachedEncoder(encoder)
+    baseline = SymSubGenerator(encoder)
+    cached = SymSubGenerator(cached_encoder)
+    requests = get_requests(baseline, questions)
+
+    start = time.perf_counter()
+    expected = baseline._get_best_sense_keys(requests)
+    baseline_time = time.perf_counter() - start
+
+    for run in ["cold", "warm"]:
+        start = time.perf_counter()
+        keys = cached._get_best_sense_keys(requests)
+        elapsed = time.perf_counter() - start
+
+        assert keys == expected, "Cached embeddings changed the disambiguated senses"
+        print(f"Cached ({run}): {elapsed / len(requests) * 1000:.2f} ms/word, speedup {baseline_time / elapsed:.2f}x")
+
+    stats = cached_encoder.stats()
+    print(f"Baseline:      {baseline_time / len(requests) * 1000:.2f} ms/word")
+    print(f"Hit rate: {stats['cache']['hit_rate'] * 100:.1f}%, texts encoded: {stats['encoded']}, "
+          f"memory: {stats['cache']['memory']['bytes'] / 2 ** 20:.1f} MiB")
+    for name in ['lookup_latency', 'encode_latency']:
+        latency = stats[name]
+        print(f"{name}: p50 {latency['p50'] * 1000:.2f} ms, p95 {latency['p95'] * 1000:.2f} ms, "
+              f"p99 {latency['p99'] * 1000:.2f} ms over {latency['count']} calls")
+
+
+def benchmark_batching(questions, num_threads=8, request_size=8):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from qgen.encoder.universal_sentence_encoder import USEEncoder
+
+    encoder = USEEncoder(USE_PATH)
+    # small requests, as sent by SymSub for a few words at a time
+    requests = [questions[i:i + request_size] for i in range(0, len(questions), request_size)]
+
+    start = time.perf_counter()
+    expected = [encoder.encode_sentences(request) for request in requests]
+    direct_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(num_threads) as executor:
+        embeddings = list(executor.map(encoder.get_vectors, requests))
+    batched_time = time.perf_counter() - start
+    encoder.close()
+
+    agreement = min(np.inner(e1, e2).diagonal().min() for e1, e2 in zip(embeddings, expected))
+    stats = encoder.stats()
+    print(f"Direct:   {direct_time / len(questions) * 1000:.2f} ms/question ({len(requests)} forward passes)")
+    print(f"Batched:  {batched_time / len(questions) * 1000:.2f} ms/question ({stats['batches']} forward passes, "
+          f"mean size {stats['batch_size']['mean']:.1f})")
+    print(f"Speedup:  {direct_time / batched_time:.2f}x, minimum cosine similarity: {agreement:.4f}")
+    print(f"Forward pass latency: p50 {stats['batch_latency']['p50'] * 1000:.2f} ms, "
+          f"p99 {stats['batch_latency']['p99'] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=["senses", "selection", "embeddings", "batching"], default="senses",
+                        help="Stage to benchmark: extraction of the extended glosses (senses) or the whole word sense "
+                             "disambiguation, including sentence embeddings (selection)")
+    parser.add_argument("--input_path",
+                        help="Path to input file in plain text, each question is separated by newline. "
+                             "Use built-in sample questions if not specified")
+
+    args = parser.parse_args()
+
+    inputs = read_file(args.input_path) if args.input_path else SAMPLE_QUESTIONS
+    if args.target == "senses":
+        benchmark_senses(inputs)
+    elif args.target == "selection":
+        benchmark_selection(inputs)
+    elif args.target == "embeddings":
+        benchmark_embeddings(inputs)
+    elif args.target == "batching":
+        benchmark_batching(inputs)
@@ -1,10 +1,15 @@
 import argparse
-import json
 import os
-from collections import defaultdict
 
+from tqdm import tqdm
+
+from qgen.encoder.cache import CachedEncoder
 from qgen.encoder.universal_sentence_encoder import USEEncoder
-from qgen.generator import FPMGenerator, SymSubGenerator, IMTGenerator, ZeroShotGenerator, EDAGenerator
+from qgen.generator import FPMGenerator, SymSubGenerator, HybridGenerator, IMTGenerator, ZeroShotGenerator, \
+    EDAGenerator
+from qgen.util.checkpoint import Checkpoint, parse_question
+from qgen.util.file import ResultsWriter
+from qgen.util.wordnet import load_gloss_store, load_sense_index, load_synonym_table
 
 ROOT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 
@@ -15,6 +20,17 @@ AQA_RL_MODEL_PATH = os.path.join(ROOT_PATH, 'model/pretrained/active-qa/translat
 # IMT_PATH = os.path.join(ROOT_PATH, 'model/onmt_model_step_15000.pt')
 ONMT_PATH = os.path.join(ROOT_PATH, 'OpenNMT-py')
 USE_PATH = os.path.join(ROOT_PATH, 'model/pretrained/universal_sentence_encoder')
+CACHE_PATH = os.path.join(ROOT_PATH, 'model/cache')
+
+
+def get_symsub_generator(workers=1, max_outputs=None):
+    # WordNet glosses and senses are read from the stores precomputed by `script/precompute.py`, if any
+    # glosses (if not precomputed) and repeated questions are only embedded once
+    encoder = CachedEncoder(USEEncoder(USE_PATH))
+    return SymSubGenerator(encoder, gloss_store=load_gloss_store(CACHE_PATH, encoder.name),
+                           sense_index=load_sense_index(CACHE_PATH), workers=workers,
+                           max_outputs=max_outputs)
+
 
 fpm = None
 symsub = None
@@ -25,34 +41,15 @@ zeroshot_rl = None
 eda = None
 
 
-class FPMSymSub:
-    def __init__(self, fpm_generator, symsub_generator):
-        self.fpm = fpm_generator
-        self.symsub = symsub_generator
-        self.name = "Hybrid mode (FPM + SymSub)"
-
-    def batch_generate(self, sentences):
-        print("Generating with FPM...")
-        temp1 = self.symsub.batch_generate(sentences)
-        print("Generating with SymSub...")
-        temp2 = self.fpm.batch_generate([s for k, v in temp1.items() for s in [k] + v])
-
-        results = defaultdict(list)
-        for key, values in temp1.items():
-            results[key].extend(temp2[key])
-            for value in values:
-                results[key].extend(temp2[value])
-
-        return results
-
-
-def main(method, input_path, output_path, batch_size=2500):
+def main(method, input_path, output_path, batch_size=2500, workers=1, resume=False, max_outputs=None):
     if method == 'fpm':
-        generator = FPMGenerator()
+        generator = FPMGenerator(CACHE_PATH, workers)
     elif method == 'symsub':
-        generator = SymSubGenerator(USEEncoder(USE_PATH))
+        generator = get_symsub_generator(workers, max_outputs)
     elif method == 'hybrid':
-        generator = FPMSymSub(FPMGenerator(), SymSubGenerator(USEEncoder(USE_PATH)))
+        # variants are capped too, so that the synonym expansion of a question never outgrows its output budget
+        generator = HybridGenerator(FPMGenerator(CACHE_PATH, workers), get_symsub_generator(workers, max_outputs),
+                                    max_outputs)
     # elif method == 'imt':
     #     generator = IMTGenerator(ONMT_PATH, IMT_PATH, n_best=5)
     elif method == 'zeroshot':
@@ -60,40 +57,59 @@ def main(method, input_path, output_path, batch_size=2500):
     elif method == 'zeroshot-rl':
         generator = ZeroShotGenerator(AQA_PATH, AQA_CONFIG_PATH, AQA_RL_MODEL_PATH)
     elif method == 'eda':
-        generator = EDAGenerator()
+        generator = EDAGenerator(synonym_table=load_synonym_table(CACHE_PATH), workers=workers)
     else:
         print("Unknown method. Default to fpm generator")
         generator = fpm
 
     print(f"Generating questions via {generator.name}...")
-    results = dict()
-    batch_counter = 0
+    checkpoint = Checkpoint(method, input_path, output_path)
+    if resume:
+        checkpoint.restore()
+    else:
+        checkpoint.reset()
+    batch_counter = len(checkpoint.batches)
 
-    def process_batch(_batch):
+    def process_batch(_batch, _start, _end):
         if len(_batch) > 0:
-            nonlocal results, batch_counter
+            nonlocal batch_counter
             print(f"Processing batch #{batch_counter}...")
-            results.update(generator.batch_generate(_batch))
+            # results are written as soon as they are generated, so memory does not grow with the input size
+            num_generated = 0
+            if method == 'eda':
+                # the random stream of each question depends on its index in the whole input, including the
+                # batches of the previous runs
+                generated_batch = generator.iter_generate(_batch, start=checkpoint.num_questions)
+            else:
+                generated_batch = generator.iter_generate(_batch)
+            for question, generated in tqdm(generated_batch, total=len(_batch)):
+                writer.write(question, generated)
+                num_generated += len(generated)
+            checkpoint.commit(_start, _end, _batch, writer.flush(), num_generated)
             batch_counter += 1
 
-    with open(input_path, 'r', encoding='utf-8') as f:
-        batch_counter = 0
+    # the input is read in binary mode so that batches can be located by their byte offsets
+    with open(input_path, 'rb') as f, ResultsWriter(checkpoint.results_path, mode='a') as writer:
+        f.seek(checkpoint.input_offset)
+        start = end = checkpoint.input_offset
         batch = []
         for line in f:
-            if len(line.strip()) != 0:
-                batch.append(line.strip())
+            end += len(line)
+            question = parse_question(line)
+            if question is not None:
+                batch.append(question)
                 if len(batch) == batch_size:
-                    process_batch(batch)
+                    process_batch(batch, start, end)
+                    start = end
                     batch = []
 
-        process_batch(batch)
-
-    print(f"Saving result to {output_path}...")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f)
+        process_batch(batch, start, end)
+    generator.close()
+    checkpoint.finalize()
 
-    num_generated = sum([len(v) for v in results.values()])
-    print(f"Done. Number of questions generated: {num_generated} ({num_generated / len(results) * 100}% increases)")
+    num_questions = checkpoint.num_questions
+    num_generated = checkpoint.num_generated
+    print(f"Done. Number of questions generated: {num_generated} ({num_generated / num_questions * 100}% increases)")
 
 
 if __name__ == '__main__':
@@ -105,8 +121,17 @@ if __name__ == '__main__':
     parser.add_argument("--input_path",
                         help="Path to input file in plain text, each question is separated by newline")
     parser.add_argument("--output_path",
-                        help="Path to output file in json format, each question maps to a list of generated questions")
+                        help="Path to output file in json format, each question maps to a list of generated questions. "
+                             "Written as json lines if the path ends with '.jsonl'")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (only used by fpm, symsub, hybrid and eda)")
+    parser.add_argument("--max_outputs", type=int,
+                        help="Maximum number of questions generated from each input question (only used by symsub and "
+                             "hybrid). Unbounded if not specified")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume an interrupted run by skipping the batches already saved to the output path")
 
     args = parser.parse_args()
 
-    main(args.method, args.input_path, args.output_path)
+    main(args.method, args.input_path, args.output_path, workers=args.workers, resume=args.resume,
+         max_outputs=args.max_outputs)
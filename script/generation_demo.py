@@ -1,7 +1,9 @@
 import os
 
+from qgen.encoder.cache import CachedEncoder
 from qgen.encoder.universal_sentence_encoder import USEEncoder
 from qgen.generator import FPMGenerator, SymSubGenerator, IMTGenerator, ZeroShotGenerator, EDAGenerator
+from qgen.util.wordnet import load_gloss_store, load_sense_index, load_synonym_table
 
 ROOT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 
@@ -12,16 +14,25 @@ AQA_RL_MODEL_PATH = os.path.join(ROOT_PATH, 'model/pretrained/active-qa/translat
 # IMT_PATH = os.path.join(ROOT_PATH, 'model/onmt_model_step_15000.pt')
 ONMT_PATH = os.path.join(ROOT_PATH, 'OpenNMT-py')
 USE_PATH = os.path.join(ROOT_PATH, 'model/pretrained/universal_sentence_encoder')
+CACHE_PATH = os.path.join(ROOT_PATH, 'model/cache')
+
+
+def get_symsub_generator():
+    # WordNet glosses and senses are read from the stores precomputed by `script/precompute.py`, if any
+    # glosses (if not precomputed) and repeated questions are only embedded once
+    encoder = CachedEncoder(USEEncoder(USE_PATH))
+    return SymSubGenerator(encoder, gloss_store=load_gloss_store(CACHE_PATH, encoder.name),
+                           sense_index=load_sense_index(CACHE_PATH))
 
 
 def main():
     print("Initializing...")
-    fpm = FPMGenerator()
-    symsub = SymSubGenerator(USEEncoder(USE_PATH))
+    fpm = FPMGenerator(CACHE_PATH)
+    symsub = get_symsub_generator()
     # imt = IMTGenerator(ONMT_PATH, IMT_PATH, n_best=5)
     zeroshot = ZeroShotGenerator(AQA_PATH, AQA_CONFIG_PATH, AQA_MODEL_PATH)
     zeroshot_rl = ZeroShotGenerator(AQA_PATH, AQA_CONFIG_PATH, AQA_RL_MODEL_PATH)
-    eda = EDAGenerator()
+    eda = EDAGenerator(synonym_table=load_synonym_table(CACHE_PATH))
 
     generator = None
     while True:
@@ -0,0 +1,71 @@
+import argparse
+import os
+
+from qgen.util.wordnet import GlossStore, SenseIndex, SynonymTable, get_gloss_store_path, get_sense_index_path, \
+    get_synonym_table_path
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+USE_PATH = os.path.join(ROOT_PATH, 'model/pretrained/universal_sentence_encoder')
+GLOVE_PATH = os.path.join(ROOT_PATH, 'model/pretrained/spacy_glove/en_vectors_web_lg-2.1.0')
+FASTTEXT_PATH = os.path.join(ROOT_PATH, 'model/pretrained/fastText/cc.en.300.bin')
+CACHE_PATH = os.path.join(ROOT_PATH, 'model/cache')
+
+
+def get_encoder(name):
+    # encoders are imported on demand since each of them depends on a different framework
+    if name == 'use':
+        from qgen.encoder.universal_sentence_encoder import USEEncoder
+        return USEEncoder(USE_PATH)
+    elif name == 'glove':
+        from qgen.encoder.glove import GloveEncoder
+        return GloveEncoder(GLOVE_PATH)
+    elif name == 'fasttext':
+        from qgen.encoder.fasttext import FTEncoder
+        return FTEncoder(FASTTEXT_PATH)
+
+
+def precompute_glosses(encoder_name, cache_dir):
+    encoder = get_encoder(encoder_name)
+    path = get_gloss_store_path(cache_dir, encoder.name)
+    store = GlossStore.build(encoder, path)
+    print(f"Saved {len(store)} gloss embeddings to {path}")
+
+
+def precompute_senses(cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = get_sense_index_path(cache_dir)
+    SenseIndex.build(path)
+    print(f"Saved sense index to {path}")
+
+
+def precompute_synonyms(cache_dir):
+    path = get_synonym_table_path(cache_dir)
+    table = SynonymTable.build(path)
+    print(f"Saved synonyms of {len(table)} words to {path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache_dir", default=CACHE_PATH,
+                        help="Directory to store the precomputed resources")
+    subparsers = parser.add_subparsers(dest="resource")
+
+    glosses_parser = subparsers.add_parser("glosses", help="Embed every WordNet definition and example, used by "
+                                                           "the word sense disambiguation of symsub")
+    glosses_parser.add_argument("--encoder", choices=["use", "glove", "fasttext"], default="use",
+                                help="Encoder used to embed the glosses")
+    subparsers.add_parser("senses", help="Compute the extended gloss of every WordNet sense, used by the word sense "
+                                         "disambiguation of symsub")
+    subparsers.add_parser("synonyms", help="Compute the synonyms of every word of WordNet, used by eda")
+
+    args = parser.parse_args()
+
+    if args.resource == "glosses":
+        precompute_glosses(args.encoder, args.cache_dir)
+    elif args.resource == "senses":
+        precompute_senses(args.cache_dir)
+    elif args.resource == "synonyms":
+        precompute_synonyms(args.cache_dir)
+    else:
+        parser.print_help()